@@ -107,11 +107,11 @@ class AgentController(ControllerBase):
         agentName = self.__getCurrentAgentName()
         agentConfig = self.__getCurrentConfig()
         uri = "%s://%s" % (agentName, agentConfig)
-        agent = AgentFactory.get_agent(agentName)
         print(uri)
         try:
-            agent.open(uri)
-        except Exception, e:
+            # not pooled: Disconnect closes the device, Reconnect opens a fresh one
+            agent = AgentFactory.get_agent(uri, shared = False)
+        except AgentFactory.AgentOpenException, e:
             self.logStatus("open agent fail: %s" % e)
             return
 
@@ -33,12 +33,14 @@ class DebugCoreCanvas():
         MplCanvas.changeInfo(self.capAx, title + "-CAP", xlabel, ylabel)
         MplCanvas.plotAx(self.capAx, range(len(dataY)), dataY, draw_type)
 
-    def plotFFT(self, dataY, pattern = None):
+    def plotFFT(self, dataY, pattern = None, dataX = None):
         if not pattern:
             pattern = ("", "", "", "")
+        if dataX is None:
+            dataX = range(len(dataY))
         title, xlabel, ylabel, draw_type = pattern
         MplCanvas.changeInfo(self.fftAx, title + "-FFT", xlabel, ylabel)
-        MplCanvas.plotAx(self.fftAx, range(len(dataY)), dataY, draw_type)
+        MplCanvas.plotAx(self.fftAx, dataX, dataY, draw_type)
 
     def draw(self):
         self.capCanvas.draw()
@@ -88,6 +90,8 @@ class DebugCoreController(AnalyzerControllerBase):
             None
         ),
     }
+    # captures of the same event averaged in the spectrum
+    psdAverages = 8
 
     def __init__(self, **kw):
         AnalyzerControllerBase.__init__(self, **kw)
@@ -137,6 +141,8 @@ class DebugCoreController(AnalyzerControllerBase):
         self.maxPoint = ("adc" in eventName) and 2048 or 8192
         self.ui.dbgcPoint.setText(str(self.maxPoint))
         self.__resetPrePoints()
+        # another event, start the average over
+        self.analyzer.spectrum.reset()
 
     def __resetPrePoints(self):
         self.ui.dbgcPrepoint.clear()
@@ -159,6 +165,11 @@ class DebugCoreController(AnalyzerControllerBase):
 
         return prePoing
 
+    def __captureProgress(self, done, total):
+        self.logStatus("Capture %d/%d" % (done, total))
+        # repaint the status bar, no user input meanwhile
+        QtCore.QCoreApplication.processEvents(QtCore.QEventLoop.ExcludeUserInputEvents)
+
     # ==================================
     # Event Callback
     # ==================================
@@ -177,9 +188,10 @@ class DebugCoreController(AnalyzerControllerBase):
         points = self.__getCurrentPoints()
         prePoint = self.__getCurrentPrePoint()
         eventName = self.__getCurrentEventName()
-        dumpInfo = self.analyzer.trigger_func(eventName, points, prePoint)
+        dumpInfo = self.analyzer.trigger_func(eventName, points, prePoint,
+                                              self.__captureProgress)
 
-        if not dumpInfo:
+        if dumpInfo is None or len(dumpInfo) == 0:
             self.logStatus("Capture Fail")
             return
         else:
@@ -194,8 +206,10 @@ class DebugCoreController(AnalyzerControllerBase):
         # draw fft
         if fftPattern:
             fftX, fftY, fftType = fftPattern
-            fftInfo = self.analyzer.fft(dumpInfo)
-            self.canvas.plotFFT(fftInfo, (title, fftX, fftY, fftType))
+            freq, fftInfo = self.analyzer.psd(dumpInfo, self.psdAverages)
+            self.canvas.plotFFT(fftInfo, (title, fftX, fftY, fftType), freq)
+            self.logStatus("Capture Success, spectrum of %d captures" %
+                           self.analyzer.spectrum.count)
         else:
             fftInfo = []
             self.canvas.plotFFT([])
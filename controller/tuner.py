@@ -228,6 +228,7 @@ class TunerController(AnalyzerControllerBase):
     def __loGet(self, thread):
         agentCtl = self.getAgentController()
         agentCtl.lockAgent()
+        self.analyzer.sync()
         self.__lo = self.analyzer.get_lo()
 
     def __loGetFinished(self):
@@ -268,6 +269,8 @@ class TunerController(AnalyzerControllerBase):
             self.logStatus("Error, please choose LO")
             return
 
+        # the regs may have been written behind the tuner's shadow
+        self.analyzer.sync()
         res = self.analyzer.set_lo(lo)
         self.logStatus("Set LO %s" % (res and "Success" or "fail"))
 
@@ -284,6 +287,7 @@ class TunerController(AnalyzerControllerBase):
 
     @QtCore.Slot()
     def on_paGet_clicked(self):
+        self.analyzer.sync((2, ))
         item  = self.analyzer.get_pa()
         pa1 = self._dumpGainInfo(self.analyzer.GAIN_PA1, item.pa1)
         rfvga = self._dumpGainInfo(self.analyzer.GAIN_RFVGA, item.rfvga)
@@ -299,6 +303,7 @@ class TunerController(AnalyzerControllerBase):
     @QtCore.Slot()
     def on_paSet_clicked(self):
         item = self._currentPAItem()
+        self.analyzer.sync((2, ))
         result = self.analyzer.set_pa(item)
         self.logStatus("PA set: %s" % result and "success" or "fail")
 
@@ -312,6 +317,7 @@ class TunerController(AnalyzerControllerBase):
 
     @QtCore.Slot()
     def on_lnaGet_clicked(self):
+        self.analyzer.sync((2, ))
         item  = self.analyzer.get_lna()
         lna1 = self._dumpGainInfo(self.analyzer.GAIN_LNA1, item.lna1)
         lna2 = self._dumpGainInfo(self.analyzer.GAIN_LNA2, item.lna2)
@@ -327,6 +333,7 @@ class TunerController(AnalyzerControllerBase):
     @QtCore.Slot()
     def on_lnaSet_clicked(self):
         item = self._currentLNAItem()
+        self.analyzer.sync((2, ))
         result = self.analyzer.set_lna(item)
         self.logStatus("LNA set: %s" % result and "success" or "fail")
 
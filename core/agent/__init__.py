@@ -2,4 +2,10 @@ from c88xx_agent_base import C88xxAgentBase
 
 # Agent Register
 import mmp_agent
-# import scpi_agent
+import mmp_fleet
+import sim_agent
+import record_agent
+try:
+    import scpi_agent
+except NotImplementedError:
+    pass # the scpi transports are Linux only
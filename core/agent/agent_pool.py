@@ -0,0 +1,179 @@
+import time
+import threading
+from agent_proxy import AgentProxy
+from priority_gate import priority, PRIO_POLL
+
+'''
+# Usage: AgentPool
+
+    # every get_agent() on the same URI shares one opened agent
+    a = C88xxAgentBase.get_agent("mmp://eth0")
+    b = C88xxAgentBase.get_agent("MMP://eth0/")
+    assert(a.agent is b.agent)
+
+    a.close()   # only the handle
+    b.close()   # the agent is closed after idle_timeout
+
+    # an agent failing its health ping is closed once its last handle
+    # is released, the next get_agent() opens a fresh one
+
+    # a private agent, not pooled
+    c = C88xxAgentBase.get_agent("mmp://eth0", shared = False)
+'''
+class _Entry(object):
+    def __init__(self, key, agent):
+        self.key = key
+        self.agent = agent
+        self.refs = 0
+        self.checked = time.time() # last time it was checked
+        self.released = None       # last time refs dropped to 0
+        self.stale = False         # failed a ping, closed on the last release
+
+class AgentHandle(AgentProxy):
+    '''
+    refcounted view on a pooled agent, close() only releases the handle
+    '''
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self._closed = False
+
+    @property
+    def agent(self):
+        # the pool may reopen the agent behind the handle
+        return self._entry.agent
+
+    def open(self, uri):
+        raise self.AgentOpenException("pooled agent is already opened")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pool.release(self._entry)
+
+class AgentPool(object):
+    idle_timeout = 30       # sec, close an agent nobody holds
+    health_interval = 10    # sec, ping an agent unchecked for that long
+
+    def __init__(self, opener):
+        '''
+        opener: (agent_cls, uri) -> opened agent, raise on failure
+        '''
+        self._opener = opener
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(uri):
+        '''
+        "MMP://eth0/?b=1&a=2" -> "mmp://eth0?a=2&b=1"
+        '''
+        scheme, _, rest = uri.strip().partition("://")
+        path, _, query = rest.partition("?")
+        opts = sorted(kv for kv in query.split("&") if kv)
+        key = "%s://%s" % (scheme.lower(), path.rstrip("/"))
+        if opts:
+            key += "?" + "&".join(opts)
+        return key
+
+    def acquire(self, agent_cls, uri):
+        key = self.normalize(uri)
+        self.__check(key)
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                entry = self._entries[key] = _Entry(key, None)
+            if entry.agent is None:
+                try:
+                    entry.agent = self._opener(agent_cls, uri)
+                except:
+                    if not entry.refs:
+                        del self._entries[key]
+                    raise
+                entry.checked = time.time()
+            entry.refs += 1
+            return AgentHandle(self, entry)
+
+    def release(self, entry):
+        with self._lock:
+            entry.refs -= 1
+            if entry.refs > 0:
+                return
+            entry.released = time.time()
+            if entry.stale or self.idle_timeout <= 0:
+                self.__drop(entry)
+                return
+
+        timer = threading.Timer(self.idle_timeout, self.__reap, [entry])
+        timer.daemon = True
+        timer.start()
+
+    def __reap(self, entry):
+        with self._lock:
+            if entry.refs > 0 or entry.released is None:
+                return
+            if time.time() - entry.released < self.idle_timeout:
+                return # released again later, its own timer comes
+            self.__drop(entry)
+
+    def __check(self, key):
+        '''
+        ping the agent of `key` if unchecked for health_interval,
+        out of the lock, a dead device must not block the other URIs
+        '''
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None or entry.agent is None or entry.stale:
+                return
+            if time.time() - entry.checked < self.health_interval:
+                return
+            entry.checked = time.time() # nobody else pings it meanwhile
+            agent = entry.agent
+
+        try:
+            # a health check, the requests of the callers go first
+            with priority(PRIO_POLL):
+                ok = agent.ping()
+        except Exception, e:
+            print("agent %s: ping error %s" % (key, e))
+            ok = False
+        if ok:
+            return
+
+        with self._lock:
+            if entry.agent is not agent:
+                return # dropped meanwhile
+            if entry.refs > 0:
+                # the handles out keep using it till released
+                entry.stale = True
+            else:
+                self.__drop(entry)
+
+    def __close(self, entry):
+        try:
+            entry.agent.close()
+        except Exception, e:
+            print("agent %s: close error %s" % (entry.key, e))
+
+    def __drop(self, entry):
+        if self._entries.get(entry.key, None) is entry:
+            del self._entries[entry.key]
+        if entry.agent is not None:
+            self.__close(entry)
+        entry.agent = None
+
+    def list(self):
+        '''
+        return {normalized uri: handles}
+        '''
+        with self._lock:
+            return dict((key, entry.refs) for key, entry in self._entries.items())
+
+    def clear(self):
+        '''
+        close every pooled agent, the handles still out become unusable
+        '''
+        with self._lock:
+            for entry in self._entries.values():
+                self.__drop(entry)
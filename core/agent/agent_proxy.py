@@ -0,0 +1,71 @@
+from c88xx_agent_base import C88xxAgentBase
+
+class AgentProxy(C88xxAgentBase):
+    '''
+    forward the whole interface to `agent`, every call goes through
+    _call(), so a subclass can wrap all of them in one place
+    or override only the methods it cares about
+    '''
+    def __init__(self, agent = None):
+        self.agent = agent
+
+    def __getattr__(self, name):
+        # agent specific extras, such as set_vid, set_pipeline
+        if name == "agent":
+            raise AttributeError(name)
+        return getattr(self.agent, name)
+
+    def _call(self, name, *args):
+        return getattr(self.agent, name)(*args)
+
+    # ======================================================
+    # implement interface
+    # ======================================================
+    def open(self, uri):
+        return self.agent.open(uri)
+
+    def close(self):
+        return self.agent.close()
+
+    def get_oam(self, inst, reg, *args):
+        return self._call("get_oam", inst, reg, *args)
+
+    def set_oam(self, inst, reg, value, *args):
+        return self._call("set_oam", inst, reg, value, *args)
+
+    def get_ana(self, reg, *args):
+        return self._call("get_ana", reg, *args)
+
+    def set_ana(self, reg, value, *args):
+        return self._call("set_ana", reg, value, *args)
+
+    def get_oam_many(self, regs, *args):
+        return self._call("get_oam_many", regs, *args)
+
+    def set_oam_many(self, items, *args):
+        return self._call("set_oam_many", items, *args)
+
+    def get_ana_many(self, regs, *args):
+        return self._call("get_ana_many", regs, *args)
+
+    def set_ana_many(self, items, *args):
+        return self._call("set_ana_many", items, *args)
+
+    def get_tuner(self, reg, *args):
+        return self._call("get_tuner", reg, *args)
+
+    def set_tuner(self, reg, data, *args):
+        return self._call("set_tuner", reg, data, *args)
+
+    def setup_dbgc(self, cs, tr_event, tp, tr_mode, *args):
+        return self._call("setup_dbgc", cs, tr_event, tp, tr_mode, *args)
+
+    def dump_dbgc(self, samples = 2048, *args):
+        return self._call("dump_dbgc", samples, *args)
+
+    def stream_dbgc(self, samples = 2048, progress = None, *args):
+        # a generator, not through _call()
+        return self.agent.stream_dbgc(samples, progress, *args)
+
+    def list_resource(self):
+        return self.agent.list_resource()
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import bisect
+import threading
+
+'''
+# Usage: AgentStats
+
+    agent = C88xxAgentBase.get_agent("mmp://eth0/...")
+    ...
+    snap = agent.stats.snapshot()
+    print(snap["commands"]["get_oam"]["rtt"]["mean"])
+
+    # dump a snapshot every 5 sec
+    agent.stats.start_writer("agent_stats.json", 5)
+    agent.stats.stop_writer()
+'''
+class CommandStats(object):
+    # RTT histogram, upper bound of every bucket in sec, the last is +inf
+    buckets = (0.0001, 0.0002, 0.0005,
+               0.001, 0.002, 0.005,
+               0.01, 0.02, 0.05,
+               0.1, 0.2, 0.5,
+               1, 2, 5)
+
+    def __init__(self):
+        self.count = 0      # requests
+        self.timeouts = 0   # requests given up
+        self.retries = 0    # retransmits
+        self.rtt_n = 0
+        self.rtt_sum = 0.0
+        self.rtt_min = None
+        self.rtt_max = None
+        self.hist = [0] * (len(self.buckets) + 1)
+
+    def add_rtt(self, rtt):
+        self.rtt_n += 1
+        self.rtt_sum += rtt
+        self.rtt_min = rtt if self.rtt_min is None else min(self.rtt_min, rtt)
+        self.rtt_max = rtt if self.rtt_max is None else max(self.rtt_max, rtt)
+        self.hist[bisect.bisect_left(self.buckets, rtt)] += 1
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "rtt": {
+                "n": self.rtt_n,
+                "min": self.rtt_min,
+                "max": self.rtt_max,
+                "mean": self.rtt_sum / self.rtt_n if self.rtt_n else None,
+                # [[upper bound(None: +inf), n], ...]
+                "hist": [list(x) for x in zip(self.buckets + (None, ), self.hist)],
+            },
+        }
+
+class AgentStats(object):
+    '''
+    per command counters & RTT histogram of one agent
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._writer = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._commands = {}
+            self.stray = 0      # responds nobody waits for
+            self.mismatch = 0   # seq matched, mmptype did not
+            self.since = time.time()
+
+    def __get(self, cmd):
+        stats = self._commands.get(cmd, None)
+        if stats is None:
+            stats = self._commands[cmd] = CommandStats()
+        return stats
+
+    def request(self, cmd):
+        with self._lock:
+            self.__get(cmd).count += 1
+
+    def retry(self, cmd):
+        with self._lock:
+            self.__get(cmd).retries += 1
+
+    def timeout(self, cmd):
+        with self._lock:
+            self.__get(cmd).timeouts += 1
+
+    def rtt(self, cmd, rtt):
+        with self._lock:
+            self.__get(cmd).add_rtt(rtt)
+
+    def add_stray(self):
+        with self._lock:
+            self.stray += 1
+
+    def add_mismatch(self):
+        with self._lock:
+            self.mismatch += 1
+
+    def snapshot(self):
+        '''
+        return {"since", "now", "stray", "mismatch", "commands": {cmd: {...}}}
+        '''
+        with self._lock:
+            return {
+                "since": self.since,
+                "now": time.time(),
+                "stray": self.stray,
+                "mismatch": self.mismatch,
+                "commands": dict((cmd, stats.snapshot())
+                                 for cmd, stats in self._commands.items()),
+            }
+
+    # ------------------------------------------------------
+    # periodic file writer
+    # ------------------------------------------------------
+    def write(self, path):
+        # write & rename, a reader never sees half a file
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent = 1, sort_keys = True)
+        os.rename(tmp, path)
+
+    def __write_loop(self, path, interval, stop):
+        while not stop.wait(interval):
+            try:
+                self.write(path)
+            except (IOError, OSError), e:
+                print("stats: write %s fail: %s" % (path, e))
+        self.write(path)
+
+    def start_writer(self, path, interval = 5):
+        self.stop_writer()
+        stop = threading.Event()
+        thread = threading.Thread(target = self.__write_loop, args = (path, interval, stop))
+        thread.daemon = True
+        thread.start()
+        self._writer = (thread, stop)
+
+    def stop_writer(self):
+        if not self._writer:
+            return
+        thread, stop = self._writer
+        self._writer = None
+        stop.set()
+        thread.join()
@@ -3,6 +3,7 @@ class C88xxAgentBase(object):
     # class attribute & method
     # ------------------------------------------------------
     _agent_classes = {}
+    _pool = None
 
     @classmethod
     def register(cls, agent_type):
@@ -25,24 +26,65 @@ class C88xxAgentBase(object):
         return inner
 
     @classmethod
-    def get_agent(cls, info):
+    def get_agent(cls, info, shared = True):
         '''
         info:   UIR or agent_type
+                ?cache or ?cache=<sec> on any URI: read registers through
+                a CachedAgent, with its default ttl or `sec` for every space
+        shared: URI only, share one opened agent per URI, the result is a
+                refcounted handle, close() it when done
+
+        raise AgentOpenException if the URI can not be opened
         '''
         infos = info.split("://")
         key = str(infos[0]).lower()
         agent_cls = cls._agent_classes.get(key, None)
+        if len(infos) == 1:
+            # not opened, such as for list_resource()
+            return agent_cls and agent_cls()
+
         if not agent_cls:
-            return None
+            raise cls.AgentOpenException("unknown agent type: %s" % info)
+        if shared:
+            return cls.get_pool().acquire(agent_cls, info)
+        return cls._open_agent(agent_cls, info)
+
+    @staticmethod
+    def _pop_option(uri, name):
+        '''
+        return (uri without the query option `name`, its value or None)
+        '''
+        base, _, query = uri.partition("?")
+        opts = [kv for kv in query.split("&") if kv]
+        rest = [kv for kv in opts if kv.partition("=")[0] != name]
+        if len(rest) == len(opts):
+            return uri, None
+        value = [kv.partition("=")[2] for kv in opts if kv not in rest][-1]
+        return base + ("?" + "&".join(rest) if rest else ""), value
 
+    @classmethod
+    def _open_agent(cls, agent_cls, uri):
+        uri, cache = cls._pop_option(uri, "cache")
+        agent = agent_cls()
         try:
-            agent = agent_cls()
-            if len(infos) > 1:
-                # setting with URI
-                agent.open(info)
-            return agent
-        except:
-            return None
+            agent.open(uri)
+        except Exception, e:
+            try:
+                agent.close() # half opened
+            except Exception:
+                pass
+            raise cls.AgentOpenException("open %s fail: %s" % (uri, str(e) or type(e).__name__))
+        if cache is not None:
+            from cached_agent import CachedAgent
+            agent = CachedAgent(agent, float(cache) if cache else None)
+        return agent
+
+    @classmethod
+    def get_pool(cls):
+        if C88xxAgentBase._pool is None:
+            from agent_pool import AgentPool
+            C88xxAgentBase._pool = AgentPool(cls._open_agent)
+        return C88xxAgentBase._pool
 
     @classmethod
     def list_agent(cls):
@@ -127,6 +169,49 @@ class C88xxAgentBase(object):
         '''
         raise NotImplementedError
 
+    # ------------------------------------------------------
+    # bulk interface, agents may override with a faster version
+    # ------------------------------------------------------
+    def get_oam_many(self, regs):
+        '''
+        input:
+        regs: [(llid, reg), ...]
+        -------
+        output:
+        [uint16 or None, ...], same order as regs
+        '''
+        return [self.get_oam(llid, reg) for llid, reg in regs]
+
+    def set_oam_many(self, items):
+        '''
+        input:
+        items: [(llid, reg, data), ...]
+        -------
+        output:
+        [not None or None, ...], same order as items
+        '''
+        return [self.set_oam(llid, reg, data) for llid, reg, data in items]
+
+    def get_ana_many(self, regs):
+        '''
+        input:
+        regs: [reg, ...]
+        -------
+        output:
+        [uint16 or None, ...], same order as regs
+        '''
+        return [self.get_ana(reg) for reg in regs]
+
+    def set_ana_many(self, items):
+        '''
+        input:
+        items: [(reg, data), ...]
+        -------
+        output:
+        [not None or None, ...], same order as items
+        '''
+        return [self.set_ana(reg, data) for reg, data in items]
+
     def get_tuner(self, reg):
         '''
         input:
@@ -175,12 +260,38 @@ class C88xxAgentBase(object):
         '''
         raise NotImplementedError
 
+    def stream_dbgc(self, samples, progress = None):
+        '''
+        input:
+        samples:  as dump_dbgc()
+        progress: callback(chunks done, chunks total), or None
+        -------
+        output:
+        yield (offset, [uint32, ...]) as the chunks arrive, in any order,
+        offset counts in samples; a chunk lost is not yielded
+        '''
+        # agents without chunks: the whole dump is one chunk
+        data = self.dump_dbgc(samples)
+        if data is None or len(data) == 0:
+            return
+        if progress:
+            progress(1, 1)
+        yield 0, data
+
     def list_resource(self):
         '''
         return {resource:desc}
         '''
         raise NotImplementedError
 
+    def ping(self):
+        '''
+        health check of an opened agent
+        output:
+            True if the device answers
+        '''
+        return self.get_oam(0x7e, 0xfd) is not None
+
     def uri_help(self, samples):
         '''
         return uri help info
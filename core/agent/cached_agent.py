@@ -0,0 +1,242 @@
+import time
+import threading
+from agent_proxy import AgentProxy
+from request_window import RequestFuture
+
+'''
+# Usage: CachedAgent
+
+    agent = CachedAgent(C88xxAgentBase.get_agent("mmp://eth0/..."))
+    C88xxPower(agent).set_power(-10)    # E1 read once, then from cache
+
+    # the same from the URI, any agent type, ttl 0.5 sec for every space
+    agent = C88xxAgentBase.get_agent("mmp://eth0/...?cache=0.5")
+
+    # registers changed behind the agent's back
+    agent.invalidate("oam", 0xe1)
+    agent.invalidate()                  # everything
+
+# Cache
+
+    write-through, a successful set_* updates the cached value,
+    a failed one drops it; a value lives `ttl[space]` sec
+
+    volatile registers always go to the wire, so do setup_dbgc/dump_dbgc,
+    the debug core status is never cached
+
+    concurrent reads of the same register share one wire request
+'''
+class CachedAgent(AgentProxy):
+    # sec a cached value is trusted, per space
+    ttl = {"oam": 1.0, "ana": 5.0, "tuner": 5.0}
+
+    # {space: regs never cached}, OAM by reg of any inst
+    volatile = {
+        "oam":   frozenset([0x74, 0x75,     # tuner handshake
+                            0x85, 0x8a]),   # agc, status
+        "ana":   frozenset(),
+        "tuner": frozenset(),
+    }
+
+    # {(space, reg): spaces dropped after writing it}
+    side_effects = {
+        ("oam", 0x74):   ("tuner", ),   # raw tuner handshake
+        ("tuner", 0x04): ("tuner", ),   # tuner reset
+    }
+
+    def __init__(self, agent, ttl = None):
+        '''
+        ttl: sec, for every space; default per space, see CachedAgent.ttl
+        '''
+        AgentProxy.__init__(self, agent)
+        if ttl is not None:
+            self.ttl = dict((space, ttl) for space in self.ttl)
+        self._lock = threading.Lock()
+        self._cache = {}    # {key: (value, expire)}
+        self._pending = {}  # {key: RequestFuture}, reads on the wire
+        self._writes = {}   # {key: times written or invalidated}
+        self._flushes = 0   # times the whole cache was invalidated
+        self._tuner_addr = False # get_tuner echoes addr << 8
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------------------------------------------
+    # cache
+    # ------------------------------------------------------
+    @staticmethod
+    def _key(space, reg, args):
+        # args: the optional dst of the agent
+        return (space, reg) + tuple(args)
+
+    def _cacheable(self, key):
+        space, reg = key[:2]
+        if space == "oam":
+            reg = reg[1]
+        return reg not in self.volatile[space]
+
+    def __touch(self, key):
+        # a read on the wire meanwhile must not store its value
+        self._writes[key] = self._writes.get(key, 0) + 1
+        self._cache.pop(key, None)
+
+    def invalidate(self, space = None, reg = None):
+        '''
+        space: "oam", "ana", "tuner", None for all
+        reg:   OAM (inst, reg) or reg, None for all of the space
+        '''
+        with self._lock:
+            if space is None:
+                self._cache.clear()
+                self._flushes += 1
+                return
+            for key in self._cache.keys() + self._pending.keys():
+                if key[0] != space:
+                    continue
+                if reg is None or key[1] == reg or \
+                        (space == "oam" and not isinstance(reg, tuple) and key[1][1] == reg):
+                    self.__touch(key)
+
+    def __read(self, keys, fetch):
+        '''
+        keys:  [key, ...]
+        fetch: [key, ...] -> [value or None, ...], the misses
+        return [value or None, ...], same order as keys
+        '''
+        now = time.time()
+        results = [None] * len(keys)
+        mine = []       # [(index, key)], fetched by this call
+        waits = []      # [(index, future)], fetched by another thread
+        with self._lock:
+            flushes = self._flushes
+            for i, key in enumerate(keys):
+                if not self._cacheable(key):
+                    mine.append((i, key))
+                    continue
+                value, expire = self._cache.get(key, (None, 0))
+                if expire > now:
+                    results[i] = value
+                    self.hits += 1
+                    continue
+                self.misses += 1
+                future = self._pending.get(key, None)
+                if future:
+                    waits.append((i, future))
+                    continue
+                self._pending[key] = RequestFuture(key, self._writes.get(key, 0))
+                mine.append((i, key))
+
+        values = []
+        try:
+            if mine:
+                values = fetch([key for i, key in mine])
+        finally:
+            with self._lock:
+                expire = time.time()
+                for n, (i, key) in enumerate(mine):
+                    value = values[n] if n < len(values) else None
+                    results[i] = value
+                    future = self._pending.pop(key, None)
+                    if future is None:
+                        continue # volatile
+                    if value is not None and flushes == self._flushes and \
+                            future.info == self._writes.get(key, 0):
+                        self._cache[key] = (value, expire + self.ttl[key[0]])
+                    future.set_result(value)
+
+        for i, future in waits:
+            results[i] = future.wait()
+        return results
+
+    def __write(self, items, store):
+        '''
+        items: [(key, value), ...]
+        store: [key, ...] -> [not None or None, ...]
+        '''
+        with self._lock:
+            for key, value in items:
+                self.__touch(key)
+        results = store([key for key, value in items])
+
+        drops = set()
+        with self._lock:
+            expire = time.time()
+            for (key, value), ret in zip(items, results):
+                self.__touch(key)
+                space, reg = key[:2]
+                if space == "oam":
+                    reg = reg[1]
+                drops.update(self.side_effects.get((space, reg), ()))
+                if ret is not None and self._cacheable(key):
+                    self._cache[key] = (value, expire + self.ttl[space])
+        for space in drops:
+            self.invalidate(space)
+        return results
+
+    # ======================================================
+    # implement interface
+    # ======================================================
+    def ping(self):
+        # the health check must reach the device, never the cache
+        return self.agent.ping()
+
+    def get_oam(self, inst, reg, *args):
+        key = self._key("oam", (inst & 0xff, reg & 0xff), args)
+        return self.__read([key], lambda keys:
+                [self._call("get_oam", inst, reg, *args)])[0]
+
+    def set_oam(self, inst, reg, value, *args):
+        key = self._key("oam", (inst & 0xff, reg & 0xff), args)
+        return self.__write([(key, value & 0xffff)], lambda keys:
+                [self._call("set_oam", inst, reg, value, *args)])[0]
+
+    def get_ana(self, reg, *args):
+        key = self._key("ana", reg & 0xff, args)
+        return self.__read([key], lambda keys:
+                [self._call("get_ana", reg, *args)])[0]
+
+    def set_ana(self, reg, value, *args):
+        key = self._key("ana", reg & 0xff, args)
+        return self.__write([(key, value & 0xffff)], lambda keys:
+                [self._call("set_ana", reg, value, *args)])[0]
+
+    def get_oam_many(self, regs, *args):
+        keys = [self._key("oam", (inst & 0xff, reg & 0xff), args) for inst, reg in regs]
+        return self.__read(keys, lambda keys:
+                self._call("get_oam_many", [key[1] for key in keys], *args))
+
+    def set_oam_many(self, items, *args):
+        items = [(self._key("oam", (inst & 0xff, reg & 0xff), args), value & 0xffff)
+                 for inst, reg, value in items]
+        return self.__write(items, lambda keys:
+                self._call("set_oam_many", [key[1] + (value, ) for key, value in items], *args))
+
+    def get_ana_many(self, regs, *args):
+        keys = [self._key("ana", reg & 0xff, args) for reg in regs]
+        return self.__read(keys, lambda keys:
+                self._call("get_ana_many", [key[1] for key in keys], *args))
+
+    def set_ana_many(self, items, *args):
+        items = [(self._key("ana", reg & 0xff, args), value & 0xffff)
+                 for reg, value in items]
+        return self.__write(items, lambda keys:
+                self._call("set_ana_many", [(key[1], value) for key, value in items], *args))
+
+    def __get_tuner(self, reg, *args):
+        value = self._call("get_tuner", reg, *args)
+        if value is not None:
+            self._tuner_addr = value > 0xff
+        return value
+
+    def get_tuner(self, reg, *args):
+        key = self._key("tuner", reg & 0xff, args)
+        return self.__read([key], lambda keys:
+                [self.__get_tuner(reg, *args)])[0]
+
+    def set_tuner(self, reg, data, *args):
+        key = self._key("tuner", reg & 0xff, args)
+        # cache the value as get_tuner reads it back
+        value = data & 0xff
+        if self._tuner_addr:
+            value |= (reg & 0xff) << 8
+        return self.__write([(key, value)], lambda keys:
+                [self._call("set_tuner", reg, data, *args)])[0]
@@ -0,0 +1,62 @@
+import time
+
+'''
+# Usage: CompletionPoller
+
+    poller = CompletionPoller()
+
+    start = time.time()
+    trigger()
+    last = 0    # sec after the trigger of the last poll not done
+    for wait in poller.waits(key, time.time() - start):
+        time.sleep(wait)
+        polled = time.time() - start
+        if done(): break
+        last = polled
+    else:
+        timeout
+    # it completed between the last two polls
+    poller.learn(key, (last + polled) / 2)
+'''
+class CompletionPoller(object):
+    '''
+    poll schedule of a device operation of unknown duration:
+    first around the typical completion time learned per key,
+    then exponential backoff from a sub-millisecond interval
+    '''
+    alpha = 1.0 / 4     # weight of the newest completion time
+    factor = 2
+
+    def __init__(self, min_interval = 0.0005, max_interval = 0.2, timeout = 2.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self._typical = {} # key: sec
+
+    def typical(self, key):
+        '''
+        smoothed completion time of `key`, None if never seen
+        '''
+        return self._typical.get(key, None)
+
+    def learn(self, key, elapsed):
+        typical = self._typical.get(key, None)
+        if typical is None:
+            self._typical[key] = elapsed
+        else:
+            self._typical[key] = (1 - self.alpha) * typical + self.alpha * elapsed
+
+    def waits(self, key, elapsed = 0):
+        '''
+        elapsed: sec since the trigger, already spent
+        yield sec to sleep before every poll, until `timeout` after the trigger
+        '''
+        deadline = time.time() + self.timeout - elapsed
+        typical = self._typical.get(key, 0)
+        wait = max(typical - elapsed, self.min_interval)
+        # slower than usual: restart small around the typical time
+        step = max(typical / 8, self.min_interval)
+        while time.time() < deadline:
+            yield wait
+            wait = step
+            step = min(step * self.factor, self.max_interval)
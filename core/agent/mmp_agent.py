@@ -1,14 +1,27 @@
 import os
 import time
-import random
+import mmap
+import select
 import socket
 import struct
+import threading
+import collections
+import logging
+import contextlib
 import netifaces
+import numpy as np
 from c88xx_agent_base import C88xxAgentBase
+from request_window import RequestWindow
+from rtt_estimator import RttEstimator
+from priority_gate import PriorityGate, priority, PRIO_POLL, PRIO_BULK
+from agent_stats import AgentStats
+from completion_poller import CompletionPoller
 
 import platform
 current_os = platform.system()
 
+log = logging.getLogger(__name__)
+
 def mac2arr(mac):
     if not mac:
         return None
@@ -22,6 +35,9 @@ def mac2arr(mac):
         return None
     return map(lambda x:int(x, 16), mac_list)
 
+def arr2mac(arr):
+    return ":".join(map(lambda x: "%02x" % x, arr))
+
 def str2arr(s):
     return [ord(c) for c in s]
 
@@ -36,12 +52,86 @@ def bytes2int(bs):
 
 if current_os == "Linux":
     import fcntl
+    import ctypes
+
+    SO_ATTACH_FILTER = 26
+    SIOCGSTAMPNS = 0x8907
+
+    # classic BPF opcode
+    BPF_LD_W_ABS = 0x20
+    BPF_LD_H_ABS = 0x28
+    BPF_LD_B_ABS = 0x30
+    BPF_JEQ_K    = 0x15
+    BPF_JSET_K   = 0x45
+    BPF_RET_K    = 0x06
+
     class NetRawLinux(object):
         def open(self, dev, proto):
             self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, proto)
             self.sock.bind((dev, proto))
             info = fcntl.ioctl(self.sock.fileno(), 0x8927,  struct.pack('256s', dev[:15]))
             self.src_mac = [ord(char) for char in info[18:24]]
+            self._proto = proto
+            self._filter = None
+            self.rx_stamp = None # kernel receive time of the last frame
+            self._stamp = False
+            self.set_filter()
+
+        @staticmethod
+        def _gen_filter(proto, dst_mac, src_mac = None):
+            '''
+            accept: ethertype == proto && dst == dst_mac && mmptype is respond
+                    (&& src == src_mac)
+            return [(code, jt, jf, k), ...]
+            '''
+            def mac_ins(offset, mac):
+                return [
+                    (BPF_LD_W_ABS, 0, 0, offset),
+                    (BPF_JEQ_K,    0, None, bytes2int(mac[0:4])),
+                    (BPF_LD_H_ABS, 0, 0, offset + 4),
+                    (BPF_JEQ_K,    0, None, bytes2int(mac[4:6])),
+                ]
+
+            ins = [(BPF_LD_H_ABS, 0, 0, 12),
+                   (BPF_JEQ_K,    0, None, proto)]
+            ins.extend(mac_ins(0, dst_mac))
+            ins.extend([(BPF_LD_B_ABS, 0, 0, 16),
+                        (BPF_JSET_K,   0, None, 0x01)])
+            if src_mac:
+                ins.extend(mac_ins(6, src_mac))
+            ins.append((BPF_RET_K, 0, 0, 0xffff)) # accept
+
+            # jf None: jump to drop, which is the last instruction
+            drop = len(ins)
+            ins = [(code, jt, drop - i - 1 if jf is None else jf, k)
+                    for i, (code, jt, jf, k) in enumerate(ins)]
+            ins.append((BPF_RET_K, 0, 0, 0))      # drop
+            return ins
+
+        def set_filter(self, dev_mac = None, drain = True):
+            '''
+            drop everything but the MMP responds to us in kernel
+            dev_mac: [uint8, ...], only accept responds from dev_mac
+            drain:   drop the frames already queued, only while nobody
+                     else reads the socket
+            '''
+            ins = self._gen_filter(self._proto, self.src_mac, dev_mac)
+            prog = "".join(struct.pack("HBBI", *i) for i in ins)
+            # keep a reference, the kernel copies it, but be safe
+            self._filter = ctypes.create_string_buffer(prog)
+            fprog = struct.pack("HL", len(ins), ctypes.addressof(self._filter))
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+            if not drain:
+                return
+
+            # drop frames queued before the filter
+            self.sock.setblocking(0)
+            try:
+                while self.sock.recv(2048):
+                    pass
+            except socket.error:
+                pass
+            self.sock.setblocking(1)
 
         def close(self):
             self.sock.close()
@@ -56,10 +146,30 @@ if current_os == "Linux":
             try:
                 rdata = self.sock.recv(nbytes)
             except socket.timeout:
-                print("timeout")
+                pass
 
+            if rdata and self._stamp:
+                self.rx_stamp = self._get_stamp()
             return rdata
 
+        def _get_stamp(self):
+            # no recvmsg in python2, ask the socket for the stamp of the last frame
+            try:
+                ts = fcntl.ioctl(self.sock.fileno(), SIOCGSTAMPNS, struct.pack("ll", 0, 0))
+            except IOError:
+                return None # nothing stamped yet
+            sec, nsec = struct.unpack("ll", ts)
+            return sec + nsec * 1e-9
+
+        def set_timestamp(self, on):
+            '''
+            on: stamp every received frame in kernel, see rx_stamp
+            '''
+            if on:
+                self._get_stamp() # the first query turns stamping on
+            self._stamp = on
+            self.rx_stamp = None
+
         def get_hw_addr(self):
             return self.src_mac
 
@@ -68,7 +178,119 @@ if current_os == "Linux":
             ifs = netifaces.interfaces()
             return dict(zip(ifs, ifs))
 
+    SOL_PACKET = 263
+    PACKET_RX_RING = 5
+    PACKET_VERSION = 10
+    TPACKET_V3 = 2
+    TP_STATUS_KERNEL = 0
+    TP_STATUS_USER = 1
+
+    class NetRawLinuxRing(NetRawLinux):
+        '''
+        receive through a memory-mapped TPACKET_V3 ring,
+        every poll() drains a whole block of frames
+        '''
+        block_size = 1 << 16
+        block_nr = 8
+        frame_size = 2048
+        block_timeout = 1 # ms, retire a block which is not full
+
+        def open(self, dev, proto):
+            NetRawLinux.open(self, dev, proto)
+            sock = self.sock
+            sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            # struct tpacket_req3
+            req = struct.pack("IIIIIII", self.block_size, self.block_nr,
+                    self.frame_size,
+                    self.block_size * self.block_nr // self.frame_size,
+                    self.block_timeout, 0, 0)
+            sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+            self._ring = mmap.mmap(sock.fileno(), self.block_size * self.block_nr,
+                    mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self._poll = select.poll()
+            self._poll.register(sock.fileno(), select.POLLIN | select.POLLERR)
+            self._block = 0
+            self._frames = collections.deque()
+            self._stamps = collections.deque()
+
+        def close(self):
+            self._ring.close()
+            NetRawLinux.close(self)
+
+        def _block_ready(self):
+            off = self._block * self.block_size
+            # tpacket_block_desc.hdr.bh1.block_status
+            status = struct.unpack_from("I", self._ring, off + 8)[0]
+            return status & TP_STATUS_USER
+
+        def _fetch_block(self):
+            ring = self._ring
+            off = self._block * self.block_size
+            num_pkts, first = struct.unpack_from("II", ring, off + 12)
+            pkt = off + first
+            for i in range(num_pkts):
+                # struct tpacket3_hdr
+                next_off, sec, nsec, snaplen, length, status, mac, net = \
+                        struct.unpack_from("IIIIIIHH", ring, pkt)
+                self._frames.append(ring[pkt + mac: pkt + mac + snaplen])
+                self._stamps.append(sec + nsec * 1e-9)
+                pkt += next_off
+
+            # give the block back to kernel
+            struct.pack_into("I", ring, off + 8, TP_STATUS_KERNEL)
+            self._block = (self._block + 1) % self.block_nr
+
+        def _wait_frames(self, timeout):
+            if self._frames:
+                return True
+            deadline = time.time() + timeout
+            while not self._block_ready():
+                remain = deadline - time.time()
+                if remain <= 0:
+                    return False
+                self._poll.poll(remain * 1000)
+            self._fetch_block()
+            return True
+
+        def recv_batch(self, timeout):
+            '''
+            return all the frames of the next ready block, [] when timeout
+            '''
+            if not self._wait_frames(timeout):
+                return []
+            frames = list(self._frames)
+            self._frames.clear()
+            if self._stamp:
+                self.rx_stamp = self._stamps[-1]
+            self._stamps.clear()
+            return frames
+
+        def recv(self, nbytes, timeout):
+            if not self._wait_frames(timeout):
+                return []
+            stamp = self._stamps.popleft()
+            if self._stamp:
+                self.rx_stamp = stamp
+            return self._frames.popleft()[:nbytes]
+
+        def set_timestamp(self, on):
+            # every frame in the ring is stamped by kernel anyway
+            self._stamp = on
+            self.rx_stamp = None
+
+        def set_filter(self, dev_mac = None, drain = True):
+            NetRawLinux.set_filter(self, dev_mac, drain)
+            if not drain or not getattr(self, "_ring", None):
+                return
+
+            # drop frames already in the ring
+            while self._block_ready():
+                self._fetch_block()
+            self._frames.clear()
+            self._stamps.clear()
+
     NetRaw = NetRawLinux
+    NetRawRing = NetRawLinuxRing
 elif current_os == "Windows":
     import fnmatch
 
@@ -123,14 +345,27 @@ elif current_os == "Windows":
             pass
 
         def _cmmp_check(self, rdata):
-            if len(rdata) < 0:
+            if len(rdata) < 0x11:
                 return False
             if rdata[12:14] != self._proto:
                 return False
             if ord(rdata[0x10]) & 0x01 != 1:
                 return False
+            if rdata[0:6] != self._dst_filter:
+                return False
+            if self._src_filter and rdata[6:12] != self._src_filter:
+                return False
             return True
 
+        def set_filter(self, dev_mac = None, drain = True):
+            '''
+            only accept the MMP responds to us
+            dev_mac: [uint8, ...], only accept responds from dev_mac
+            drain:   nothing is queued before the filter here
+            '''
+            self._dst_filter = arr2str(self._src_mac)
+            self._src_filter = dev_mac and arr2str(dev_mac)
+
         def open(self, dev, proto):
             self._dev = self.get_info_by_name(dev)[0]
             if not self._dev:
@@ -141,6 +376,7 @@ elif current_os == "Windows":
 
             self._wincap = WinPcapOnce(self._dev, timeout = 1)
             self._wincap.register_handle()
+            self.set_filter()
 
         def close(self):
             self._wincap.unregister_handle()
@@ -160,7 +396,6 @@ elif current_os == "Windows":
                     break
                 now = time.time()
             else:
-                print("timeout")
                 rdata = ""
             return rdata
 
@@ -185,10 +420,14 @@ elif current_os == "Windows":
             return res
 
     NetRaw = NetRawWindows
+    NetRawRing = None
 else:
     print("UNKNOW OS: %s" % current_os)
     raise NotImplementedError
 
+# one entry of MMPAgent.discover()
+DeviceInfo = collections.namedtuple("DeviceInfo", "mac dev_type regs")
+
 @C88xxAgentBase.register("mmp")
 class MMPAgent(C88xxAgentBase):
     mmp_cmd = {"get_oam":0x00a0,
@@ -198,6 +437,7 @@ class MMPAgent(C88xxAgentBase):
                "get_debug_core":0x00b8,
                "set_debug_core":0x00ba,
                }
+    broadcast_mac = [0xff, 0xff, 0xff, 0xff, 0xff, 0xff]
 
     @staticmethod
     def str2arr(s):
@@ -218,6 +458,7 @@ class MMPAgent(C88xxAgentBase):
     def __init__(self):
         self.src_mac = []
         self.dst_mac = [0xaa, 0xbb, 0xcc, 0xdd, 0xee, 0xff]
+        self.filter_mac = None # source MAC filter set by open()
         self.vlan_extend = [0x81, 0x00]
         self.vlan_vid = [0x00, 0x00]
         self.package_ret = [0x88, 0xcc, 0xc0, 0xff]
@@ -226,85 +467,557 @@ class MMPAgent(C88xxAgentBase):
         self.proto = [0x80, 0x07]
         self.version = [0x20]
         self.func_dic = {"vlan":False, "reflet":False}
+        self.frame_min = 64
+        self._templates = {}
 
         # os detection
         self.net = NetRaw()
-        self.timeout = 1 # sec
-        self.retry = 3
+        self.timeout = 1 # sec, initial & max timeout
+        self.retry = 3   # retransmit times
+        self.window = 8  # requests in flight for mmp_send_many
+        self.dbgc_burst = 32 # debug core chunks per mmp_send_many
+        self.dbgc_retry = 5  # times a lost chunk is asked again
+        # pipeline only, drop the respond not from the request's dst
+        self.match_src = False
+        # fixed timeout for slow commands, instead of the RTT estimation,
+        # a debug core chunk gets the whole 1 sec it always had
+        self.cmd_timeout = {"get_debug_core": self.timeout}
+        self._rtt = RttEstimator(initial = self.timeout)
+        self.stats = AgentStats()
+
+        # pipeline: in-flight table keyed by seq, filled by __recv_loop
+        self._seq_lock = threading.Lock()
+        self._window = None
+        self._receiver = None
+        self._receiving = False
+        self._rx_lock = threading.Lock() # held by __recv_loop, parks it
+        self._parked = False  # __recv_loop parked, the gated path reads
+        self._listener = None # (seq, mmptype, callback) for broadcast
+        # one request on the socket at a time, unless pipeline
+        self._gate = PriorityGate()
+        self._tuner_locks = {} # dst: RLock, the 0x74/0x75 handshake
+        self._tuner_poller = CompletionPoller() # learns the handshake time per dst
 
     def _agent_send(self, info):
         return self.net.send(info)
 
-    def _agent_recv(self):
-        return self.net.recv(1000, self.timeout)
+    def _agent_recv(self, timeout = None):
+        return self.net.recv(1000, timeout or self.timeout)
 
     # return xtag
     def _gen_seq(self):
-        self.seq = random.randint(0, 0xffff)
+        '''
+        monotonic sequence allocator, skip the seq still in flight
+        '''
+        with self._seq_lock:
+            seq = self.seq
+            while True:
+                seq = (seq + 1) & 0xffff
+                if not (self._window and seq in self._window):
+                    break
+            self.seq = seq
+        return seq
 
-    def _seq_check(self, buf):
-        h = (self.seq >> 8) & 0xff
-        l = self.seq & 0xff
-        return h == buf[17] and l == buf[18]
+    @staticmethod
+    def _unpack_respond(rdata):
+        '''
+        return (mmptype, seq) of a respond, or None if it is too short
+        '''
+        if len(rdata) < 22:
+            return None
+        return struct.unpack_from(">BH", rdata, 16)
 
-    def _mmptype_check(self, buf, mmptype):
-        return buf[16] == (mmptype & 0xff) + 1
+    @staticmethod
+    def _mmptype_check(rtype, mmptype):
+        return rtype == (mmptype & 0xff) + 1
+
+    def _get_template(self, dst):
+        '''
+        header template for (dst, vlan, reflet), type & seq left zero
+        '''
+        key = (tuple(dst or self.dst_mac), self.func_dic["vlan"], self.func_dic["reflet"])
+        template = self._templates.get(key, None)
+        if template is not None:
+            return template
+
+        template = bytearray(key[0])
+        template.extend(self.src_mac)
+        if self.func_dic["vlan"]:
+            template.extend(self.vlan_extend)
+            template.extend(self.vlan_vid)
+        if self.func_dic["reflet"]:
+            template.extend(self.package_ret)
+        template.extend(self.proto)
+        template.extend(self.version)
+        template.extend([0x00, 0x00]) # mmptype
+        template.extend([0x00, 0x00]) # seq
+        template.extend(self.oui)
+        self._templates[key] = template
+        return template
+
+    def _gen_frame(self, mmptype, seq, buf, dst):
+        template = self._get_template(dst)
+        hlen = len(template)
+        frame = bytearray(max(hlen + len(buf), self.frame_min))
+        frame[0:hlen] = template
+        # mmptype & seq are just before oui
+        struct.pack_into(">HH", frame, hlen - 7, mmptype, seq)
+        frame[hlen:hlen + len(buf)] = bytearray(buf)
+        return bytes(frame)
+
+    def _get_timeout(self, cmd):
+        timeout = self.cmd_timeout.get(cmd, None)
+        if timeout is None:
+            timeout = min(self._rtt.rto, self.timeout)
+        return timeout
+
+    def _rtt_sample(self, cmd, rtt):
+        if cmd not in self.cmd_timeout:
+            self._rtt.sample(rtt)
+
+    def _rx_time(self):
+        # kernel receive time if the transport has one
+        return getattr(self.net, "rx_stamp", None) or time.time()
+
+    def _timeout(self, cmd):
+        log.debug("timeout: %s", cmd)
+        self.stats.timeout(cmd)
 
     """
     @return success: respond
             fail:    None
     """
-    def mmp_send(self, mmptype, buf, dst):
-        mmptype = self.mmp_cmd[mmptype]
+    def _pipelined(self):
+        return self._receiving and not self._parked
+
+    def mmp_send(self, cmd, buf, dst):
+        if not self._pipelined():
+            with self._gate:
+                # the receiver may be back from parking once we own the gate
+                if not self._pipelined():
+                    return self.__send(cmd, buf, dst)
+        future = self.mmp_request(cmd, buf, dst)
+        return self.mmp_wait(future)
+
+    def __send(self, cmd, buf, dst):
+        mmptype = self.mmp_cmd[cmd]
 
         # set sending buffer sequence number
-        self._gen_seq()
+        seq = self._gen_seq()
+        frame = self._gen_frame(mmptype, seq, buf, dst)
+        self.stats.request(cmd)
+
+        for retry in range(self.retry + 1):
+            # send, retransmit with the same seq
+            if retry > 0:
+                self.stats.retry(cmd)
+            sent = time.time()
+            deadline = sent + self._get_timeout(cmd)
+            self._agent_send(frame)
+
+            while True:
+                # recv
+                timeout = deadline - time.time()
+                rdata = self._agent_recv(timeout) if timeout > 0 else None
+                if (not rdata) or len(rdata) == 0:
+                    break # timeout
+                # parse
+                respond = self._unpack_respond(rdata)
+                if not respond: continue
+
+                # respond check
+                rtype, rseq = respond
+                if rseq != seq:
+                    self.__stray(rdata)
+                    continue
+                if not self._mmptype_check(rtype, mmptype):
+                    self.stats.add_mismatch()
+                    continue
+                # success, RTT of a retransmitted request is ambiguous
+                rtt = self._rx_time() - sent
+                self.stats.rtt(cmd, rtt)
+                if retry == 0:
+                    self._rtt_sample(cmd, rtt)
+                return bytearray(rdata[22:])
+            self._rtt.backoff()
+
+        self._timeout(cmd)
+        return None
 
-        # combine buf
-        sdata = []
-        sdata.extend(dst or self.dst_mac)
-        sdata.extend(self.src_mac)
-        if self.func_dic["vlan"]:
-            sdata.extend(self.vlan_extend)
-            sdata.extend(self.vlan_vid)
-        if self.func_dic["reflet"]:
-            sdata.extend(self.package_ret)
-        sdata.extend(self.proto)
-        sdata.extend(self.version)
-        sdata.extend([(mmptype & 0xff00) >>8, mmptype & 0xff])
-        sdata.extend([0xff & (self.seq >> 8), 0xff & self.seq])
-        sdata.extend(self.oui)
-        sdata.extend(buf)
-        if len(sdata) < 64:
-            sdata.extend([0x00 for i in range(60)])
-
-        # send
-        self._agent_send(self.arr2str(sdata))
-
-        retry = self.retry
-        while (retry >= 0):
-            retry -= 1
-            # recv
-            rdata = self._agent_recv()
-            if (not rdata) or len(rdata) == 0: break # timeout
-            # parse
-            respond = self.str2arr(rdata)
-
-            # respond check
-            if not self._mmptype_check(respond, mmptype): continue
-            if not self._seq_check(respond): continue
-            # success
-            return respond[22:len(rdata)]
+    def mmp_send_many(self, reqs, dst = None, order = None):
+        '''
+        reqs:  [(mmptype, buf), ...]
+        order: a list, gets the index of every respond in arrival order
+        keep up to `window` frames in flight instead of one round trip each
+        return [respond or None, ...], same order as reqs
+        '''
+        if not self._pipelined():
+            with self._gate:
+                if not self._pipelined():
+                    return self.__send_many(reqs, dst, order)
+        return self.__pipeline_many(reqs, dst, order)
+
+    def __pipeline_many(self, reqs, dst, order):
+        results = [None] * len(reqs)
+        todo = collections.deque(enumerate(reqs))
+        pending = {} # idx: [future, retry]
+        done = []    # (done_at, idx)
+        wake = threading.Event() # set by every respond of ours
+        while todo or pending:
+            while todo:
+                idx, (cmd, buf) = todo[0]
+                # wait for a slot only with none of ours in flight,
+                # another caller may hold the rest of the window
+                future = self.mmp_request(cmd, buf, dst, not pending, wake)
+                if future is None:
+                    break
+                todo.popleft()
+                pending[idx] = [future, 0]
+
+            # collect whichever responded, a lost one blocks nobody
+            wake.clear()
+            now = time.time()
+            expired = False
+            retired = False
+            for idx, req in list(pending.items()):
+                future, retry = req
+                cmd, mmptype, frame, src = future.info
+                if future.done():
+                    del pending[idx]
+                    results[idx] = self.__retire(future, retry)
+                    done.append((future.done_at, idx))
+                    retired = True
+                    continue
+                if now - future.sent_at < self._get_timeout(cmd):
+                    continue
+                expired = True
+                if retry >= self.retry:
+                    self._timeout(cmd)
+                    del pending[idx]
+                    self._window.retire(future)
+                    retired = True
+                    continue
+                # retransmit with the same seq
+                future.sent_at = now
+                req[1] += 1
+                self.stats.retry(cmd)
+                self._agent_send(frame)
+            if expired:
+                self._rtt.backoff()
+            if not pending or (todo and retired):
+                continue # the freed slots to the next requests first
+
+            timeout = min(future.sent_at + self._get_timeout(future.info[0])
+                            for future, retry in pending.values()) - time.time()
+            wake.wait(max(timeout, 0.001))
+        if order is not None:
+            order.extend(idx for done_at, idx in sorted(done))
+        return results
+
+    def __send_many(self, reqs, dst, order = None):
+        results = [None] * len(reqs)
+        todo = collections.deque(enumerate(reqs))
+        pending = {} # seq: [idx, cmd, mmptype, frame, sent, retry]
+        while todo or pending:
+            while todo and len(pending) < self.window:
+                idx, (cmd, buf) = todo.popleft()
+                mmptype = self.mmp_cmd[cmd]
+                seq = self._gen_seq()
+                frame = self._gen_frame(mmptype, seq, buf, dst)
+                pending[seq] = [idx, cmd, mmptype, frame, time.time(), 0]
+                self.stats.request(cmd)
+                self._agent_send(frame)
+
+            # retransmit or give up the expired requests
+            now = time.time()
+            expired = False
+            for seq, req in list(pending.items()):
+                idx, cmd, mmptype, frame, sent, retry = req
+                if now - sent < self._get_timeout(cmd):
+                    continue
+                expired = True
+                if retry >= self.retry:
+                    self._timeout(cmd)
+                    del pending[seq]
+                    continue
+                req[4] = now
+                req[5] += 1
+                self.stats.retry(cmd)
+                self._agent_send(frame)
+            if expired:
+                self._rtt.backoff()
+            if not pending:
+                continue
+
+            timeout = min(req[4] + self._get_timeout(req[1])
+                            for req in pending.values()) - time.time()
+            rdata = self._agent_recv(max(timeout, 0.001))
+            if (not rdata) or len(rdata) == 0:
+                continue
+            respond = self._unpack_respond(rdata)
+            if not respond:
+                continue
+
+            rtype, seq = respond
+            if seq not in pending:
+                self.__stray(rdata)
+                continue
+            idx, cmd, mmptype, frame, sent, retry = pending[seq]
+            if not self._mmptype_check(rtype, mmptype):
+                self.stats.add_mismatch()
+                continue
+            del pending[seq]
+            rtt = self._rx_time() - sent
+            self.stats.rtt(cmd, rtt)
+            if retry == 0:
+                self._rtt_sample(cmd, rtt)
+            results[idx] = bytearray(rdata[22:])
+            if order is not None:
+                order.append(idx)
+        return results
+
+    # ------------------------------------------------------
+    # pipeline
+    # ------------------------------------------------------
+    def mmp_request(self, cmd, buf, dst, block = True, waiter = None):
+        '''
+        send without waiting, only available in pipeline mode
+        waiter: an Event set by the respond, to wait for several futures
+        return a future for mmp_wait(); block if the window is full,
+        or None if not `block`
+        '''
+        assert(self._receiving)
+        mmptype = self.mmp_cmd[cmd]
+        seq = self._gen_seq()
+        frame = self._gen_frame(mmptype, seq, buf, dst)
+        # register before sending, so __recv_loop never misses the respond
+        src = bytes(bytearray(dst or self.dst_mac))
+        future = self._window.acquire(seq, (cmd, mmptype, frame, src), block)
+        if future is None:
+            return None
+        future.waiter = waiter
+        future.sent_at = time.time()
+        self.stats.request(cmd)
+        self._agent_send(frame)
+        return future
+
+    def mmp_wait(self, future):
+        cmd, mmptype, frame, src = future.info
+        for retry in range(self.retry + 1):
+            if retry > 0:
+                # retransmit with the same seq
+                future.sent_at = time.time()
+                self.stats.retry(cmd)
+                self._agent_send(frame)
+            timeout = future.sent_at + self._get_timeout(cmd) - time.time()
+            if future.wait(max(timeout, 0)) is not None:
+                return self.__retire(future, retry)
+            self._rtt.backoff()
+
+        self._timeout(cmd)
+        self._window.retire(future)
         return None
 
+    def __retire(self, future, retry):
+        '''
+        account the respond of `future`, free its slot
+        return the respond
+        '''
+        cmd = future.info[0]
+        rtt = future.done_at - future.sent_at
+        self.stats.rtt(cmd, rtt)
+        # RTT of a retransmitted request is ambiguous
+        if retry == 0:
+            self._rtt_sample(cmd, rtt)
+        self._window.retire(future)
+        return future.wait(0)
+
+    def __recv_loop(self):
+        while self._receiving:
+            with self._rx_lock:
+                rdata = self._agent_recv(0.1)
+                if rdata and len(rdata) > 0:
+                    self.__dispatch(rdata)
+
+    def __dispatch(self, rdata):
+        '''
+        hand a respond to the broadcast listener or its in-flight request
+        '''
+        respond = self._unpack_respond(rdata)
+        if not respond:
+            return
+
+        rtype, seq = respond
+        listener = self._listener
+        if listener and listener[0] == seq:
+            if self._mmptype_check(rtype, listener[1]):
+                listener[2](rdata)
+            return
+        future = self._window.lookup(seq)
+        if future is None:
+            self.stats.add_stray()
+            return
+        cmd, mmptype, frame, src = future.info
+        if not self._mmptype_check(rtype, mmptype):
+            self.stats.add_mismatch()
+            return
+        if self.match_src and rdata[6:12] != src:
+            self.stats.add_mismatch()
+            return
+        if not self._window.complete(seq, bytearray(rdata[22:])):
+            self.stats.add_stray() # retired meanwhile
+
+    def __stray(self, rdata):
+        # read by the gated path while __recv_loop is parked:
+        # may be the respond of an in-flight pipelined request
+        if self._parked:
+            self.__dispatch(rdata)
+        else:
+            self.stats.add_stray()
+
+    @contextlib.contextmanager
+    def _socket_owned(self):
+        '''
+        the socket to the current thread: gated requests wait, the
+        pipeline receiver is parked, requests of this thread take the
+        gated path, responds of the in-flight ones still reach them
+        '''
+        with self._gate:
+            if not self._receiving:
+                yield
+                return
+            with self._rx_lock:
+                self._parked = True
+                try:
+                    yield
+                finally:
+                    self._parked = False
+
+    def set_pipeline(self, on, window = None):
+        '''
+        on:     keep up to `window` requests in flight, responds are
+                collected by a background thread
+        '''
+        if self._receiving:
+            self._receiving = False
+            self._receiver.join()
+            self._receiver = None
+            self._window = None
+
+        if not on:
+            return
+
+        self._window = RequestWindow(window or self.window)
+        self._receiving = True
+        self._receiver = threading.Thread(target = self.__recv_loop)
+        self._receiver.daemon = True
+        self._receiver.start()
+
+    # ------------------------------------------------------
+    # broadcast
+    # ------------------------------------------------------
+    def __collect(self, seq, mmptype, deadline, callback):
+        if self._pipelined():
+            # __recv_loop hands the responds to self._listener
+            time.sleep(max(deadline - time.time(), 0))
+            return
+
+        while True:
+            timeout = deadline - time.time()
+            rdata = self._agent_recv(timeout) if timeout > 0 else None
+            if (not rdata) or len(rdata) == 0:
+                break
+            respond = self._unpack_respond(rdata)
+            if not respond: continue
+            rtype, rseq = respond
+            if rseq != seq:
+                self.__stray(rdata)
+            elif self._mmptype_check(rtype, mmptype):
+                callback(rdata)
+
+    def mmp_broadcast(self, cmd, buf, window = 0.5):
+        '''
+        send one request to every device on the link and collect the
+        responds for `window` sec, the source MAC filter is not changed
+        return {src_mac(6 bytes str): respond}, in arrival order
+        '''
+        mmptype = self.mmp_cmd[cmd]
+        seq = self._gen_seq()
+        frame = self._gen_frame(mmptype, seq, buf, self.broadcast_mac)
+        responds = collections.OrderedDict()
+
+        def collect(rdata):
+            src = bytes(rdata[6:12])
+            if src not in responds:
+                responds[src] = bytearray(rdata[22:])
+
+        gated = not self._pipelined()
+        if gated:
+            self._gate.acquire()
+            if self._pipelined():
+                self._gate.release()
+                gated = False
+        self._listener = (seq, mmptype, collect)
+        try:
+            start = time.time()
+            for probe in (1, 2):
+                # probe again halfway, in case the broadcast is lost
+                self._agent_send(frame)
+                self.__collect(seq, mmptype, start + window * probe / 2.0, collect)
+        finally:
+            self._listener = None
+            if gated:
+                self._gate.release()
+        return responds
+
+    def discover(self, window = 0.5, regs = ()):
+        '''
+        find the devices on the link with one broadcast get_oam(0x7e, 0xfd)
+        window: sec to wait for responds
+        regs:   [(inst, reg), ...], read from every device found
+        return [DeviceInfo(mac, dev_type, {(inst, reg): value}), ...]
+        '''
+        with self._socket_owned():
+            # accept responds from any device meanwhile, nothing queued is
+            # drained, those are the responds of the requests in flight
+            self.net.set_filter(drain = False)
+            try:
+                responds = self.mmp_broadcast("get_oam", [0x7e, 0xfd], window)
+                inventory = []
+                for src, res in responds.items():
+                    mac = str2arr(src)
+                    values = self.get_oam_many(regs, mac) if regs else []
+                    inventory.append(DeviceInfo(arr2mac(mac), self._parse_u16(res),
+                                                dict(zip(regs, values))))
+            finally:
+                self.net.set_filter(self.filter_mac, drain = False)
+        return inventory
+
     # ======================================================
     # implement interface
     # ======================================================
+    @staticmethod
+    def _parse_uri(uri):
+        '''
+        URI: mmp://eth?/mac_addr?opt=value&opt=value
+        return ([eth?, mac_addr], {opt: value})
+        '''
+        path, _, query = uri.partition("://")[-1].partition("?")
+        opts = dict(kv.partition("=")[::2] for kv in query.split("&") if kv)
+        return path.split("/"), opts
+
     def open(self, uri):
-        # URI: mmp://eth?/mac_addr
-        info = uri.partition("://")[-1].split("/")
+        # URI: mmp://eth?/mac_addr?rx=socket|ring&ts=user|kernel
+        info, opts = self._parse_uri(uri)
         if not (info and info[0]):
-            raise self.AgentOpenException
+            raise self.AgentOpenException("mmp uri needs a device: mmp://eth?/mac_addr")
+        rx = opts.get("rx", "socket")
+        if rx == "ring":
+            if not NetRawRing:
+                raise self.AgentOpenException("rx=ring unsupported on %s" % current_os)
+            self.net = NetRawRing()
+        elif rx != "socket":
+            raise self.AgentOpenException("unknown rx backend: %s" % rx)
         mac = None
         if len(info) >= 2:
             mac = info[1]
@@ -312,21 +1025,43 @@ class MMPAgent(C88xxAgentBase):
 
         proto = (self.bytes2int(self.proto))
         self.net.open(dev, proto)
+        ts = opts.get("ts", "user")
+        if ts == "kernel":
+            if not hasattr(self.net, "set_timestamp"):
+                raise self.AgentOpenException("ts=kernel unsupported on %s" % current_os)
+            self.net.set_timestamp(True)
+        elif ts != "user":
+            raise self.AgentOpenException("unknown ts source: %s" % ts)
         self.src_mac = self.net.get_hw_addr()
+        self._templates.clear()
         dst_mac = self.mac2arr(mac)
-        if not dst_mac: print("error dst mac input, using default dst mac")
+        if mac and not dst_mac:
+            print("error dst mac input, using default dst mac")
         self.dst_mac = dst_mac or self.dst_mac
+        if dst_mac:
+            self.net.set_filter(dst_mac)
+            self.filter_mac = dst_mac
 
     def close(self):
+        self.set_pipeline(False)
         self.net.close()
 
-    def get_oam(self, inst, reg, dst = None):
-        buf = [inst & 0xff, reg & 0xff]
-        ret = self.mmp_send("get_oam", buf, dst)
+    def ping(self):
+        # opened without a MAC: the default dst never answers the probe
+        if self.filter_mac is None:
+            return True
+        return C88xxAgentBase.ping(self)
+
+    @staticmethod
+    def _parse_u16(ret):
         if ret and ret[0] == 0:
             return (ret[1] << 8) + ret[2]
         else:
-            return None;
+            return None
+
+    def get_oam(self, inst, reg, dst = None):
+        buf = [inst & 0xff, reg & 0xff]
+        return self._parse_u16(self.mmp_send("get_oam", buf, dst))
 
     def set_oam(self, inst, reg, value, dst = None):
         buf = [inst & 0xff, reg & 0xff, (value >> 8) &0xff, value & 0xff]
@@ -334,17 +1069,51 @@ class MMPAgent(C88xxAgentBase):
 
     def get_ana(self, reg, dst = None):
         buf = [reg & 0xff]
-        ret = self.mmp_send("get_ana", buf, dst)
-        if ret and ret[0] == 0:
-            return (ret[1] << 8) + ret[2]
-        else:
-            return None;
+        return self._parse_u16(self.mmp_send("get_ana", buf, dst))
 
     def set_ana(self, reg, value, dst = None):
         buf = [reg & 0xff, (value >> 8) &0xff, value & 0xff]
         return self.mmp_send("set_ana", buf, dst)
 
-    def __tuner_cfg(self, rw, addr, data = 0):
+    def get_oam_many(self, regs, dst = None):
+        reqs = [("get_oam", [inst & 0xff, reg & 0xff]) for inst, reg in regs]
+        return map(self._parse_u16, self.mmp_send_many(reqs, dst))
+
+    def set_oam_many(self, items, dst = None):
+        reqs = [("set_oam", [inst & 0xff, reg & 0xff, (value >> 8) & 0xff, value & 0xff])
+                for inst, reg, value in items]
+        return self.mmp_send_many(reqs, dst)
+
+    def get_ana_many(self, regs, dst = None):
+        reqs = [("get_ana", [reg & 0xff]) for reg in regs]
+        return map(self._parse_u16, self.mmp_send_many(reqs, dst))
+
+    def set_ana_many(self, items, dst = None):
+        reqs = [("set_ana", [reg & 0xff, (value >> 8) & 0xff, value & 0xff])
+                for reg, value in items]
+        return self.mmp_send_many(reqs, dst)
+
+    def _tuner_lock(self, dst):
+        key = tuple(dst or self.dst_mac)
+        lock = self._tuner_locks.get(key, None)
+        if lock is None:
+            lock = self._tuner_locks.setdefault(key, threading.RLock())
+        return lock
+
+    def __tuner_cfg(self, rw, addr, data = 0, dst = None):
+        # nobody else may touch 0x74/0x75 of the device meanwhile
+        cmd = "get_tuner" if rw == "read" else "set_tuner"
+        with self._tuner_lock(dst):
+            self.stats.request(cmd)
+            start = time.time()
+            ret = self.__tuner_handshake(rw, addr, data, dst)
+        if ret is None:
+            self.stats.timeout(cmd)
+        else:
+            self.stats.rtt(cmd, time.time() - start)
+        return ret
+
+    def __tuner_handshake(self, rw, addr, data, dst):
         reg = (addr & 0xff) << 8 | data & 0xff
         if rw == "read":
             o74_req = 0xf001
@@ -353,29 +1122,48 @@ class MMPAgent(C88xxAgentBase):
             o74_req = 0xf000
             o74_res = 0xf100
 
-        if not self.set_oam(0x7e, 0x75, reg):
+        if not self.set_oam(0x7e, 0x75, reg, dst):
             print("tuner: error in set 0x75")
             return None
-        if not self.set_oam(0x7e, 0x74, o74_req):
+
+        # trigger, the first poll and the result in one burst
+        key = tuple(dst or self.dst_mac)
+        start = time.time()
+        order = []
+        res = self.mmp_send_many([
+                ("set_oam", [0x7e, 0x74, o74_req >> 8, o74_req & 0xff]),
+                ("get_oam", [0x7e, 0x74]),
+                ("get_oam", [0x7e, 0x75])], dst, order)
+        if not res[0]:
             print("tuner: error in set 0x74")
             return None
-
-        max_retry = 10
-        while max_retry >= 0:
-            max_retry -= 1
-            if self.get_oam(0x7e, 0x74) == o74_res: break
-            time.sleep(0.2)
+        # trust the poll only if the device took it after the trigger,
+        # a lost trigger retransmitted later reads the last handshake
+        if order == [0, 1, 2] and self._parse_u16(res[1]) == o74_res:
+            self._tuner_poller.learn(key, 0)
+            return self._parse_u16(res[2])
+
+        # it completes between the last poll not done and the first done
+        last = 0
+        for wait in self._tuner_poller.waits(key, time.time() - start):
+            time.sleep(wait)
+            polled = time.time() - start
+            with priority(PRIO_POLL):
+                ready = self.get_oam(0x7e, 0x74, dst) == o74_res
+            if ready: break
+            last = polled
         else:
             print("tuner: error in get 0x74")
             return None
+        self._tuner_poller.learn(key, (last + polled) / 2)
 
-        return self.get_oam(0x7e, 0x75)
+        return self.get_oam(0x7e, 0x75, dst)
 
-    def get_tuner(self, reg):
-        return self.__tuner_cfg("read", reg)
+    def get_tuner(self, reg, dst = None):
+        return self.__tuner_cfg("read", reg, dst = dst)
 
-    def set_tuner(self, reg, data):
-        return self.__tuner_cfg("write", reg, data)
+    def set_tuner(self, reg, data, dst = None):
+        return self.__tuner_cfg("write", reg, data, dst)
 
     def setup_dbgc(self, cs, tr_event, tp, tr_mode, dst = None):
         buf = []
@@ -387,35 +1175,79 @@ class MMPAgent(C88xxAgentBase):
         return res
 
     def dump_dbgc(self, samples = 2048, dst = None):
-        # XXX??? add some value for progress bar
+        '''
+        return uint32(big endian) array of `samples`, None on failure
+        '''
+        dump_info = np.zeros(samples, ">u4")
+        chunks = 0
+        for offset, words in self.stream_dbgc(samples, None, dst):
+            dump_info[offset:offset + 128] = words[:samples - offset]
+            chunks += 1
+        if chunks < (samples + 127) / 128:
+            return None # chunk lost
+        return dump_info
+
+    def __dbgc_ready(self, dst):
         # wait for debuf core ready
         wait_times = 3
         while (wait_times >= 0):
             data = self.mmp_send("get_debug_core", [1], dst)
             if not data:
-                return None # timeout
+                return False # timeout
 
             if data[0] != 4:
-                break       # ready
+                return True  # ready
 
             # not ready
             wait_times -= 1
             time.sleep(0.5)
+        return True
 
-        times = (samples + 127) / 128 # sample times
-        dump_info = []
-        for i in range(times):
-            res = self.mmp_send("get_debug_core", [i], dst)
-            if not res:
-                dump_info = [] # timeout
-                break
-            if len(res) == 513:
-                for x in range(1, 513, 4):
-                    bs = res[x:x+4]
-                    dump_info.append(self.bytes2int(bs))
-
-        self.mmp_send("get_debug_core", [0xff], dst)
-        return dump_info
+    @staticmethod
+    def _parse_dbgc_chunk(res):
+        # status + 128 * uint32, a view on the respond, no copy
+        if not res or len(res) != 513:
+            return None
+        return np.frombuffer(res, ">u4", 128, 1)
+
+    def stream_dbgc(self, samples = 2048, progress = None, dst = None, chunks = None):
+        '''
+        chunks: chunk(128 samples) indexes to fetch, default all of `samples`,
+                the ones missing from an earlier stream to resume it
+        `dbgc_burst` chunks in flight, a lost chunk is asked again alone,
+        every burst yields the wire to the interactive requests
+        see C88xxAgentBase.stream_dbgc()
+        '''
+        if chunks is None:
+            chunks = range((samples + 127) / 128)
+        todo = collections.deque(chunks)
+        tries = dict.fromkeys(todo, 0)
+        done = 0
+
+        with priority(PRIO_BULK):
+            if not self.__dbgc_ready(dst):
+                return
+        try:
+            while todo:
+                burst = [todo.popleft() for i in range(min(self.dbgc_burst, len(todo)))]
+                with priority(PRIO_BULK):
+                    res = self.mmp_send_many([("get_debug_core", [i]) for i in burst], dst)
+                for i, r in zip(burst, res):
+                    words = self._parse_dbgc_chunk(r)
+                    if words is None:
+                        tries[i] += 1
+                        if tries[i] <= self.dbgc_retry:
+                            todo.append(i)
+                        else:
+                            print("dbgc: chunk %d lost" % i)
+                        continue
+                    done += 1
+                    if progress:
+                        progress(done, len(tries))
+                    yield i * 128, words
+        finally:
+            with priority(PRIO_BULK):
+                self.mmp_send("get_debug_core", [0xff], dst)
 
     def list_resource(self):
         return self.net.list_resource()
@@ -425,7 +1257,8 @@ class MMPAgent(C88xxAgentBase):
     # ======================================================
     def set_vid(self, on, vid = 0):
         if on:
-            self.vid = [(vid & 0xf000) >> 8, vid & 0xff]
+            self.vlan_vid = [(vid >> 8) & 0x0f, vid & 0xff]
+            self._templates.clear()
         self.func_dic["vlan"] = on
 
     def set_reflet(self, on):
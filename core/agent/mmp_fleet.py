@@ -0,0 +1,163 @@
+import threading
+from c88xx_agent_base import C88xxAgentBase
+from mmp_agent import MMPAgent, NetRaw, mac2arr
+from agent_stats import AgentStats
+
+'''
+# Usage: MMPFleet
+
+    # one socket on eth0, shared by every device behind it
+    cnu1 = MMPFleet.get_device("eth0", "30:0e:d5:00:00:01")
+    cnu2 = C88xxAgentBase.get_agent("fleet://eth0/30:0e:d5:00:00:02")
+
+    # each one is a normal agent, analyzers work unchanged
+    C89xxTuner(cnu1).get_lo()
+
+    cnu1.close()
+    cnu2.close()  # the socket is closed with the last device
+
+    # who is on eth0
+    for dev in MMPFleet.discover("eth0", regs = [(0x7e, 0x00)]):
+        print(dev.mac, dev.dev_type, dev.regs)
+'''
+class MMPFleet(object):
+    '''
+    process wide table of shared links,
+    one MMPAgent in pipeline mode per interface
+    '''
+    window = 32
+
+    _links = {} # dev: [MMPAgent, refcount]
+    _lock = threading.Lock()
+
+    @classmethod
+    def attach(cls, dev):
+        with cls._lock:
+            link = cls._links.get(dev, None)
+            if not link:
+                agent = MMPAgent()
+                agent.open("mmp://%s" % dev)
+                # demux by seq and source MAC
+                agent.match_src = True
+                agent.set_pipeline(True, cls.window)
+                link = cls._links[dev] = [agent, 0]
+            link[1] += 1
+            return link[0]
+
+    @classmethod
+    def detach(cls, dev):
+        with cls._lock:
+            link = cls._links.get(dev, None)
+            if not link:
+                return
+            link[1] -= 1
+            if link[1] <= 0:
+                del cls._links[dev]
+                link[0].close()
+
+    @classmethod
+    def get_device(cls, dev, mac):
+        agent = MMPFleetAgent()
+        agent.open("fleet://%s/%s" % (dev, mac))
+        return agent
+
+    @classmethod
+    def discover(cls, dev, window = 0.5, regs = ()):
+        '''
+        broadcast probe on `dev`, see MMPAgent.discover()
+        '''
+        link = cls.attach(dev)
+        try:
+            return link.discover(window, regs)
+        finally:
+            cls.detach(dev)
+
+    @classmethod
+    def list_links(cls):
+        '''
+        return {dev: devices attached}
+        '''
+        with cls._lock:
+            return dict((dev, link[1]) for dev, link in cls._links.items())
+
+@C88xxAgentBase.register("fleet")
+class MMPFleetAgent(C88xxAgentBase):
+    '''
+    per-device view on the link shared by MMPFleet
+    '''
+    def __init__(self):
+        self.dev = None
+        self.dst_mac = None
+        self.link = None
+        self._stats = AgentStats() # the link's, kept after close
+
+    @property
+    def stats(self):
+        # counters of the shared link, every device on it
+        if self.link:
+            return self.link.stats
+        return self._stats
+
+    # ======================================================
+    # implement interface
+    # ======================================================
+    def open(self, uri):
+        # URI: fleet://eth?/mac_addr
+        info, opts = MMPAgent._parse_uri(uri)
+        if len(info) < 2 or not info[0]:
+            raise self.AgentOpenException("fleet uri needs a device: fleet://eth?/mac_addr")
+        dst_mac = mac2arr(info[1])
+        if not dst_mac:
+            raise self.AgentOpenException("error dst mac input: %s" % info[1])
+
+        self.link = MMPFleet.attach(info[0])
+        self.dev = info[0]
+        self.dst_mac = dst_mac
+
+    def close(self):
+        if self.link:
+            self._stats = self.link.stats
+            MMPFleet.detach(self.dev)
+        self.link = None
+
+    def get_oam(self, inst, reg):
+        return self.link.get_oam(inst, reg, self.dst_mac)
+
+    def set_oam(self, inst, reg, value):
+        return self.link.set_oam(inst, reg, value, self.dst_mac)
+
+    def get_ana(self, reg):
+        return self.link.get_ana(reg, self.dst_mac)
+
+    def set_ana(self, reg, value):
+        return self.link.set_ana(reg, value, self.dst_mac)
+
+    def get_oam_many(self, regs):
+        return self.link.get_oam_many(regs, self.dst_mac)
+
+    def set_oam_many(self, items):
+        return self.link.set_oam_many(items, self.dst_mac)
+
+    def get_ana_many(self, regs):
+        return self.link.get_ana_many(regs, self.dst_mac)
+
+    def set_ana_many(self, items):
+        return self.link.set_ana_many(items, self.dst_mac)
+
+    def get_tuner(self, reg):
+        return self.link.get_tuner(reg, self.dst_mac)
+
+    def set_tuner(self, reg, data):
+        return self.link.set_tuner(reg, data, self.dst_mac)
+
+    def setup_dbgc(self, cs, tr_event, tp, tr_mode):
+        return self.link.setup_dbgc(cs, tr_event, tp, tr_mode, self.dst_mac)
+
+    def dump_dbgc(self, samples = 2048):
+        return self.link.dump_dbgc(samples, self.dst_mac)
+
+    def stream_dbgc(self, samples = 2048, progress = None):
+        return self.link.stream_dbgc(samples, progress, self.dst_mac)
+
+    def list_resource(self):
+        return NetRaw.list_resource()
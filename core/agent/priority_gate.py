@@ -0,0 +1,87 @@
+import heapq
+import itertools
+import threading
+import contextlib
+
+'''
+# Usage: PriorityGate
+
+    gate = PriorityGate()
+
+    # one request on the wire at a time, reentrant for the owner
+    with gate:
+        send(...)
+        recv(...)
+
+    # the waiting thread with the best priority goes next,
+    # FIFO among the same priority
+    with priority(PRIO_BULK):
+        agent.dump_dbgc()       # each chunk yields to interactive reads
+'''
+PRIO_INTERACTIVE = 0    # default of the main(GUI) thread
+PRIO_NORMAL      = 1    # default of the others
+PRIO_POLL        = 2    # health pings, completion polls
+PRIO_BULK        = 3    # debug core dump
+
+_local = threading.local()
+
+def current_priority():
+    prio = getattr(_local, "prio", None)
+    if prio is not None:
+        return prio
+    if isinstance(threading.current_thread(), threading._MainThread):
+        return PRIO_INTERACTIVE
+    return PRIO_NORMAL
+
+@contextlib.contextmanager
+def priority(prio):
+    '''
+    requests of the current thread run at `prio` in the block
+    '''
+    old = getattr(_local, "prio", None)
+    _local.prio = prio
+    try:
+        yield
+    finally:
+        _local.prio = old
+
+class PriorityGate(object):
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._owner = None
+        self._depth = 0
+        self._waiting = []  # heap of (prio, order, thread)
+        self._order = itertools.count()
+
+    def acquire(self, prio = None):
+        me = threading.current_thread()
+        with self._cond:
+            if self._owner is me:
+                self._depth += 1
+                return
+            if prio is None:
+                prio = current_priority()
+            ticket = (prio, next(self._order), me)
+            heapq.heappush(self._waiting, ticket)
+            while self._owner is not None or self._waiting[0] is not ticket:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._owner = me
+            self._depth = 1
+
+    def release(self):
+        with self._cond:
+            assert(self._owner is threading.current_thread())
+            self._depth -= 1
+            if self._depth:
+                return
+            self._owner = None
+            if self._waiting:
+                self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
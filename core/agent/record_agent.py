@@ -0,0 +1,266 @@
+import glob
+import time
+import struct
+import threading
+import collections
+import numpy as np
+from c88xx_agent_base import C88xxAgentBase
+from agent_proxy import AgentProxy
+
+'''
+# Usage: RecordingAgent & ReplayAgent
+
+    # record a session
+    agent = RecordingAgent(C88xxAgentBase.get_agent("mmp://eth0/..."), "field.rec")
+    C88xxFrequency(agent).get_online_frequency()
+    agent.close()
+
+    # replay it, at recorded speed
+    agent = C88xxAgentBase.get_agent("replay://field.rec")
+    # or as fast as possible, only the analyzer side is left
+    agent = C88xxAgentBase.get_agent("replay://field.rec?speed=0")
+    print(agent.wire_time)  # sec the recorded agent spent on the served calls
+
+# Session file
+
+    header: "C88R" + version(uint8)
+    record: op(uint8) + start(double) + duration(double) + args + result
+            start is sec since the session began, op index of METHODS
+
+    args & result are tagged values:
+    N: None     T: True     F: False
+    I: int64    D: double
+    S: str      Y: bytearray            length(uint32) + bytes
+    L: list     length(uint32) + values
+    A: list of uint32, length(uint32) + uint32 * length
+    U: uint32 array, length(uint32) + uint32 * length, since version 2
+'''
+MAGIC = "C88R"
+VERSION = 2
+METHODS = ("get_oam", "set_oam", "get_ana", "set_ana",
+           "get_oam_many", "set_oam_many", "get_ana_many", "set_ana_many",
+           "get_tuner", "set_tuner", "setup_dbgc", "dump_dbgc")
+RECORD = struct.Struct(">Bdd")
+
+def _is_u32_array(obj):
+    dtype = getattr(obj, "dtype", None)
+    return dtype is not None and dtype.kind == "u" and dtype.itemsize == 4 \
+            and obj.ndim == 1
+
+def _is_u32_list(obj):
+    if len(obj) == 0:
+        return False
+    for x in obj:
+        if type(x) not in (int, long) or x < 0 or x > 0xffffffff:
+            return False
+    return True
+
+def encode(obj, out):
+    '''
+    append the tagged encoding of obj to out(list of str)
+    '''
+    if obj is None:
+        out.append("N")
+    elif obj is True:
+        out.append("T")
+    elif obj is False:
+        out.append("F")
+    elif isinstance(obj, (int, long)):
+        out.append("I" + struct.pack(">q", obj))
+    elif isinstance(obj, float):
+        out.append("D" + struct.pack(">d", obj))
+    elif isinstance(obj, str):
+        out.append("S" + struct.pack(">I", len(obj)) + obj)
+    elif isinstance(obj, bytearray):
+        out.append("Y" + struct.pack(">I", len(obj)) + str(obj))
+    elif _is_u32_array(obj):
+        out.append("U" + struct.pack(">I", len(obj)) + obj.astype(">u4").tostring())
+    elif _is_u32_list(obj):
+        out.append("A" + struct.pack(">I%dI" % len(obj), len(obj), *obj))
+    else:
+        obj = list(obj)
+        out.append("L" + struct.pack(">I", len(obj)))
+        for x in obj:
+            encode(x, out)
+
+def decode(buf, pos = 0):
+    '''
+    return (obj, next pos)
+    '''
+    tag = buf[pos]
+    pos += 1
+    if tag == "N":
+        return None, pos
+    if tag == "T":
+        return True, pos
+    if tag == "F":
+        return False, pos
+    if tag == "I":
+        return struct.unpack_from(">q", buf, pos)[0], pos + 8
+    if tag == "D":
+        return struct.unpack_from(">d", buf, pos)[0], pos + 8
+
+    n = struct.unpack_from(">I", buf, pos)[0]
+    pos += 4
+    if tag == "S":
+        return buf[pos:pos + n], pos + n
+    if tag == "Y":
+        return bytearray(buf[pos:pos + n]), pos + n
+    if tag == "A":
+        return list(struct.unpack_from(">%dI" % n, buf, pos)), pos + 4 * n
+    if tag == "U":
+        return np.frombuffer(buf, ">u4", n, pos).copy(), pos + 4 * n
+    if tag == "L":
+        obj = []
+        for i in range(n):
+            x, pos = decode(buf, pos)
+            obj.append(x)
+        return obj, pos
+    raise ValueError("bad tag %r at %d" % (tag, pos - 1))
+
+def read_session(path):
+    '''
+    return [(method, start, duration, args, result), ...]
+    '''
+    with open(path, "rb") as f:
+        buf = f.read()
+    if buf[:4] != MAGIC:
+        raise ValueError("%s is not a session file" % path)
+    if not 1 <= ord(buf[4]) <= VERSION:
+        raise ValueError("unsupport session version %d" % ord(buf[4]))
+
+    records = []
+    pos = 5
+    while pos < len(buf):
+        op, start, duration = RECORD.unpack_from(buf, pos)
+        args, pos = decode(buf, pos + RECORD.size)
+        result, pos = decode(buf, pos)
+        records.append((METHODS[op], start, duration, args, result))
+    return records
+
+class RecordingAgent(AgentProxy):
+    '''
+    log every request, respond and timing of `agent` to a session file
+    '''
+    def __init__(self, agent, path):
+        AgentProxy.__init__(self, agent)
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + chr(VERSION))
+        self._lock = threading.Lock()
+        self._begin = time.time()
+
+    def _call(self, name, *args):
+        start = time.time()
+        result = AgentProxy._call(self, name, *args)
+        duration = time.time() - start
+
+        out = [RECORD.pack(METHODS.index(name), start - self._begin, duration)]
+        encode(args, out)
+        encode(result, out)
+        with self._lock:
+            if self._file:
+                # flush every record, a crash keeps the session
+                self._file.write("".join(out))
+                self._file.flush()
+        return result
+
+    def stream_dbgc(self, samples = 2048, progress = None, *args):
+        # record the dump as a whole
+        return C88xxAgentBase.stream_dbgc(self, samples, progress)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+            self._file = None
+        return self.agent.close()
+
+@C88xxAgentBase.register("replay")
+class ReplayAgent(AgentProxy):
+    '''
+    serve the responds of a session file, calls are matched by
+    method & arguments in recorded order, the last respond repeats
+    '''
+    def __init__(self):
+        AgentProxy.__init__(self)
+        self.speed = 1.0    # 0: as fast as possible
+        self.wire_time = 0  # recorded sec of the served calls
+        self.missed = 0     # calls not in the session
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, args):
+        out = [name]
+        encode(args, out)
+        return "".join(out)
+
+    def _call(self, name, *args):
+        with self._lock:
+            queue = self._sessions.get(self._key(name, args), None)
+            if not queue:
+                self.missed += 1
+                print("replay: %s%r not recorded" % (name, args))
+                return None
+            duration, result = queue.popleft() if len(queue) > 1 else queue[0]
+            self.wire_time += duration
+
+        if self.speed:
+            time.sleep(duration / self.speed)
+        # a fresh copy, analyzers modify the respond in place
+        return decode(result)[0]
+
+    # ======================================================
+    # implement interface
+    # ======================================================
+    def open(self, uri):
+        # URI: replay://path/to/session.rec?speed=1
+        path, _, query = uri.partition("://")[-1].partition("?")
+        opts = dict(kv.partition("=")[::2] for kv in query.split("&") if kv)
+        try:
+            self.speed = float(opts.get("speed", 1))
+            records = read_session(path)
+        except (IOError, ValueError, struct.error), e:
+            raise self.AgentOpenException("replay %s: %s" % (path, e))
+
+        self._sessions = {}
+        for name, start, duration, args, result in records:
+            out = []
+            encode(result, out)
+            key = self._key(name, args)
+            self._sessions.setdefault(key, collections.deque()).append((duration, "".join(out)))
+        self.wire_time = 0
+        self.missed = 0
+
+    def close(self):
+        self._sessions = {}
+
+    def ping(self):
+        return True # the session may not have the probe
+
+    def stream_dbgc(self, samples = 2048, progress = None, *args):
+        # no agent to stream from, the dump was recorded as a whole
+        return C88xxAgentBase.stream_dbgc(self, samples, progress)
+
+    def list_resource(self):
+        files = glob.glob("*.rec")
+        return dict(zip(files, files))
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import sim_agent
+
+    # record -> replay round trip of a streamed dump
+    path = os.path.join(tempfile.mkdtemp(), "sim.rec")
+    rec = RecordingAgent(C88xxAgentBase.get_agent("sim://sim0?seed=1"), path)
+    rec.setup_dbgc(0, 0, sim_agent.TP_RX_ADC | 0x7ff, 0)
+    recorded = list(rec.stream_dbgc(2048, lambda done, total: None))
+    rec.close()
+
+    rep = C88xxAgentBase.get_agent("replay://%s?speed=0" % path)
+    rep.setup_dbgc(0, 0, sim_agent.TP_RX_ADC | 0x7ff, 0)
+    replayed = list(rep.stream_dbgc(2048, lambda done, total: None))
+    print("replay %s" % all(a == c and (b == d).all()
+                             for (a, b), (c, d) in zip(recorded, replayed)))
+    print("missed %d" % rep.missed)
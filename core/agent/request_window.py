@@ -0,0 +1,111 @@
+import time
+import threading
+
+'''
+# Usage: RequestWindow
+
+    window = RequestWindow(size = 8)
+
+    # sender side, block when `size` requests are already in flight
+    future = window.acquire(key)
+    # or None at once, never block while holding futures not retired
+    future = window.acquire(key, block = False)
+    send(...)
+
+    # receiver side(background thread)
+    window.complete(key, respond)
+
+    # sender side
+    respond = future.wait(timeout)  # None when timeout
+    window.retire(future)
+'''
+class RequestFuture(object):
+    def __init__(self, key, info = None):
+        self.key = key
+        self.info = info        # anything the sender wants to keep
+        self.waiter = None      # an Event set on completion as well
+        self._event = threading.Event()
+        self._result = None
+        self._retired = False
+        self.sent_at = None     # stamped by the sender
+        self.done_at = None
+
+    def set_result(self, result):
+        self._result = result
+        self.done_at = time.time()
+        self._event.set()
+        waiter = self.waiter
+        if waiter:
+            waiter.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout = None):
+        '''
+        output:
+        Success: respond
+        Fail:    None(timeout)
+        '''
+        self._event.wait(timeout)
+        return self._result
+
+class RequestWindow(object):
+    def __init__(self, size = 8):
+        self.size = size
+        self._slots = threading.Semaphore(size)
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._inflight
+
+    def __len__(self):
+        with self._lock:
+            return len(self._inflight)
+
+    def acquire(self, key, info = None, block = True):
+        '''
+        wait for a free slot and register `key` in the in-flight table
+        return None if the window is full and not `block`
+        '''
+        if not self._slots.acquire(block):
+            return None
+        future = RequestFuture(key, info)
+        with self._lock:
+            self._inflight[key] = future
+        return future
+
+    def lookup(self, key):
+        with self._lock:
+            return self._inflight.get(key, None)
+
+    def complete(self, key, result):
+        '''
+        hand a respond to the waiting future
+        return False if nobody is waiting for `key`(stray respond)
+        '''
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is None:
+            return False
+        future.set_result(result)
+        return True
+
+    def retire(self, future):
+        '''
+        release the slot of `future`, it must be called once the sender
+        stops waiting, whether the respond arrived or not
+        '''
+        with self._lock:
+            if future._retired:
+                return
+            future._retired = True
+            if self._inflight.get(future.key, None) is future:
+                del self._inflight[future.key]
+        self._slots.release()
+
+    def keys(self):
+        with self._lock:
+            return self._inflight.keys()
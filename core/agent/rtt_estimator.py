@@ -0,0 +1,44 @@
+'''
+# Usage: RttEstimator
+
+    rtt = RttEstimator(initial = 1)
+    timeout = rtt.rto               # wait this long for the respond
+    rtt.sample(recv_time - send_time)   # only for non-retransmitted request
+    rtt.backoff()                   # on timeout, before retransmit
+'''
+class RttEstimator(object):
+    '''
+    smoothed RTT/RTTVAR retransmission timer, as TCP(RFC 6298)
+    '''
+    alpha = 1.0 / 8
+    beta = 1.0 / 4
+    k = 4
+
+    # above the scheduling jitter of threads sharing an agent, a shorter
+    # timer retransmits requests whose respond is only waiting for a CPU
+    def __init__(self, initial = 1.0, min_rto = 0.2, max_rto = 3.0):
+        self.srtt = None
+        self.rttvar = None
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.rto = initial
+
+    def _clamp(self, rto):
+        return min(max(rto, self.min_rto), self.max_rto)
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.rto = self._clamp(self.srtt + self.k * self.rttvar)
+
+    def backoff(self):
+        self.rto = self._clamp(self.rto * 2)
+
+    def reset(self, initial = 1.0):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial
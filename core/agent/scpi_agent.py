@@ -2,14 +2,25 @@ import os
 import time
 import socket
 import re
+import struct
+import logging
+import collections
+import numpy as np
 from c88xx_agent_base import C88xxAgentBase
+from rtt_estimator import RttEstimator
+from priority_gate import PriorityGate, priority, PRIO_BULK
+from agent_stats import AgentStats
 
 import platform
 current_os = platform.system()
 
+log = logging.getLogger(__name__)
+
 if current_os == "Linux":
     import fcntl
     class NetUDPLinux(object):
+        stream = False # one datagram, one reply
+
         def open(self, uri):
             trsp = re.findall(r'(scpi):\/\/(\d+\.\d+\.\d+\.\d+):(\d+)', uri)
             if not trsp:
@@ -35,50 +46,281 @@ if current_os == "Linux":
             try:
                 rdata = self.sock.recvfrom(nbytes)
             except socket.timeout:
-                print("timeout")
+                pass
 
             return rdata
 
+        def flush(self):
+            '''
+            drop the late responds which are already queued
+            '''
+            self.sock.setblocking(0)
+            try:
+                while self.sock.recvfrom(65536):
+                    pass
+            except socket.error:
+                pass
+            self.sock.setblocking(1)
+
         @staticmethod
         def list_resource():
             src = ["127.0.0.1:5024"]
             return dict(zip(src, src))
 
+    class NetTCPLinux(object):
+        '''
+        one long-lived connection, commands and replies are newline framed,
+        an IEEE 488.2 definite length block(#<n><len><data>) may hold newlines,
+        so does the raw reply of `raw_replies`: uint32 length, `length` uint32
+        '''
+        stream = True # replies come back in order, no retransmit needed
+        raw_replies = (":DBGC:DUMP", )
+        raw_max = 0x10000 # uint32, a longer raw reply is a text one, such as an error
+
+        def open(self, uri):
+            trsp = re.findall(r'(scpitcp):\/\/(\d+\.\d+\.\d+\.\d+):(\d+)', uri)
+            if not trsp:
+                raise Exception("Wrong or unsupport uri.")
+            self.trsp_type = trsp[0][0]
+            self.trsp = (trsp[0][1], int(trsp[0][2]))
+            self._connect()
+
+        def _connect(self):
+            self.sock = socket.create_connection(self.trsp, 3)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._buf = ""
+            self._raw = collections.deque() # raw reply expected, per command sent
+
+        def close(self):
+            self.sock.close()
+
+        def send(self, sdata):
+            self.send_many([sdata])
+
+        def send_many(self, cmds):
+            for cmd in cmds:
+                self._raw.append(cmd.split(" ", 1)[0] in self.raw_replies)
+            self.sock.sendall("".join(cmd + "\n" for cmd in cmds))
+
+        def _reply_len(self):
+            '''
+            return the length of the first reply in _buf including the
+            newline, or None if it is not complete yet
+            '''
+            buf = self._buf
+            end = None
+            if buf[:1] == "#" and len(buf) >= 2 and buf[1] in "123456789":
+                n = int(buf[1])
+                if len(buf) < 2 + n:
+                    return None
+                end = 2 + n + int(buf[2:2 + n])
+            elif self._raw and self._raw[0]:
+                if len(buf) < 4:
+                    return None
+                length = struct.unpack_from(">I", buf)[0]
+                if length <= self.raw_max:
+                    end = 4 + 4 * length
+            if end is not None:
+                if len(buf) < end:
+                    return None
+                # the binary reply may be followed by a newline
+                return end + (buf[end:end + 1] == "\n")
+            end = buf.find("\n")
+            if end < 0:
+                return None
+            return end + 1
+
+        def recv(self, nbytes, timeout):
+            deadline = time.time() + timeout
+            while True:
+                n = self._reply_len()
+                if n is not None:
+                    reply = self._buf[:n]
+                    self._buf = self._buf[n:]
+                    raw = self._raw and self._raw.popleft()
+                    if reply[:1] != "#" and not raw:
+                        reply = reply.rstrip("\r\n")
+                    return (reply, self.trsp)
+
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    return []
+                self.sock.settimeout(timeout)
+                try:
+                    data = self.sock.recv(max(nbytes, 65536))
+                except socket.timeout:
+                    return []
+                if not data:
+                    raise socket.error("connection closed by %s:%d" % self.trsp)
+                self._buf += data
+
+        def flush(self):
+            '''
+            replies of the timed out commands are still on the way,
+            reconnect to get back in step
+            '''
+            self.sock.close()
+            self._connect()
+
+        @staticmethod
+        def list_resource():
+            src = ["127.0.0.1:5025"]
+            return dict(zip(src, src))
+
     NetUdp = NetUDPLinux
+    NetTcp = NetTCPLinux
 else:
     print("UNKNOW OS: %s" % current_os)
     raise NotImplementedError
 
+@C88xxAgentBase.register("scpitcp")
 @C88xxAgentBase.register("scpi")
 class SCPIAgent(C88xxAgentBase):
     def __init__(self):
         self.net = NetUdp()
-        self.timeout = 1 # sec
-        self.retry = 3
+        self.timeout = 1 # sec, initial & max timeout
+        self.retry = 3   # retransmit times
+        self.batch = 32  # commands per datagram(UDP) or in flight(TCP)
+        # fixed timeout for slow commands, instead of the RTT estimation,
+        # a debug core chunk gets the whole 1 sec it always had
+        self.cmd_timeout = {":DBGC:DUMP": self.timeout}
+        self._rtt = RttEstimator(initial = self.timeout)
+        self._stale = False # a late respond may be queued
+        self.block_dump = None # :DBGC:DATA? supported, None: unknown
+        self._gate = PriorityGate() # one command on the wire at a time
+        self.stats = AgentStats()
 
     def _agent_send(self, info):
         return self.net.send(info)
 
-    def _agent_recv(self):
-        return self.net.recv(2048, self.timeout)
+    def _agent_recv(self, timeout = None):
+        # a whole debug core block fits in one datagram
+        return self.net.recv(65536, timeout or self.timeout)
+
+    def _get_timeout(self, cmd):
+        if self.net.stream:
+            # nothing to retransmit, wait as long as allowed
+            return self.timeout
+        timeout = self.cmd_timeout.get(cmd, None)
+        if timeout is None:
+            timeout = min(self._rtt.rto, self.timeout)
+        return timeout
 
     """
     @return success: respond
             fail:    None
     """
-    def scpi_send(self, buf):
-        # send
-        self._agent_send(buf)
+    def scpi_send(self, buf, timeout = None, retry = None):
+        '''
+        timeout: sec for this command only, instead of the cmd_timeout/RTT one
+        retry:   retransmit times for this command only, instead of self.retry
+        '''
+        with self._gate:
+            return self.__send(buf, timeout, retry)
+
+    @staticmethod
+    def _cmd_name(buf):
+        return buf.split(" ", 1)[0].split(";", 1)[0]
+
+    def __send(self, buf, timeout = None, retry_times = None):
+        cmd = self._cmd_name(buf)
+        self.stats.request(cmd)
+        if self._stale:
+            self.net.flush()
+            self._stale = False
+
+        # the stream transport never loses a command
+        if self.net.stream:
+            retry_times = 0
+        elif retry_times is None:
+            retry_times = self.retry
+        for retry in range(retry_times + 1):
+            # send, retransmit the same command
+            if retry > 0:
+                self.stats.retry(cmd)
+            sent = time.time()
+            self._agent_send(buf)
 
-        retry = self.retry
-        while (retry >= 0):
-            retry -= 1
             # recv
-            rdata = self._agent_recv()
-            if (not rdata) or len(rdata) == 0: break # timeout
-            return rdata[0]
+            rdata = self._agent_recv(timeout or self._get_timeout(cmd))
+            if rdata and len(rdata) != 0:
+                rtt = time.time() - sent
+                self.stats.rtt(cmd, rtt)
+                # RTT of a retransmitted command is ambiguous
+                if retry == 0 and timeout is None and cmd not in self.cmd_timeout:
+                    self._rtt.sample(rtt)
+                return rdata[0]
+            self._rtt.backoff()
+            self._stale = True
+
+        log.debug("timeout: %s", cmd)
+        self.stats.timeout(cmd)
         return None
 
+    def scpi_send_many(self, cmds):
+        '''
+        join up to `batch` commands with ';' into one datagram,
+        or keep up to `batch` commands in flight on a stream
+        return [respond or None, ...], same order as cmds
+        '''
+        if self.net.stream:
+            with self._gate:
+                return self.__stream_send_many(cmds)
+
+        results = []
+        for i in range(0, len(cmds), self.batch):
+            chunk = cmds[i:i + self.batch]
+            ret = self.scpi_send(";".join(chunk))
+            if ret is None:
+                results.extend([None] * len(chunk))
+                continue
+
+            rets = [r.strip() or None for r in ret.split(";")]
+            if len(rets) != len(chunk):
+                # compound command unsupported, one by one
+                rets = [self.scpi_send(cmd) for cmd in chunk]
+            results.extend(rets)
+        return results
+
+    def __stream_send_many(self, cmds):
+        if self._stale:
+            self.net.flush()
+            self._stale = False
+
+        results = []
+        sent_at = []
+        while len(results) < len(cmds):
+            # refill when half of the window is answered
+            sent = len(sent_at)
+            if sent < len(cmds) and sent - len(results) <= self.batch / 2:
+                chunk = cmds[sent:len(results) + self.batch]
+                for cmd in chunk:
+                    self.stats.request(self._cmd_name(cmd))
+                self.net.send_many(chunk)
+                sent_at.extend([time.time()] * len(chunk))
+
+            cmd = self._cmd_name(cmds[len(results)])
+            rdata = self._agent_recv(self.timeout)
+            if not rdata:
+                log.debug("timeout: %s", cmd)
+                self.stats.timeout(cmd)
+                self._stale = True
+                results.extend([None] * (len(cmds) - len(results)))
+                break
+            self.stats.rtt(cmd, time.time() - sent_at[len(results)])
+            results.append(rdata[0] or None)
+        return results
+
+    def _parse_hex(self, ret):
+        if not ret:
+            return None
+        try:
+            return int(ret, 16)
+        except ValueError:
+            # out of step with the device, resync before the next command
+            self._stale = True
+            return None
+
     @staticmethod
     def str2arr(s):
         return [ord(c) for c in s]
@@ -87,19 +329,19 @@ class SCPIAgent(C88xxAgentBase):
     # implement interface
     # ======================================================
     def open(self, uri):
-        # URI: scpi://127.0.0.1:5024
+        # URI: scpi://127.0.0.1:5024 or scpitcp://127.0.0.1:5025
         print(uri)
+        if uri.lower().startswith("scpitcp://"):
+            self.net = NetTcp()
+        else:
+            self.net = NetUdp()
         self.net.open(uri)
 
     def close(self):
         self.net.close()
 
     def get_oam(self, inst, reg, dst = None):
-        ret = self.scpi_send(":OAMR 0x%02x%02x"%(inst, reg))
-        if ret :
-            return int(ret, 16)
-        else:
-            return None;
+        return self._parse_hex(self.scpi_send(":OAMR 0x%02x%02x"%(inst, reg)))
 
     def set_oam(self, inst, reg, value, dst = None):
         ret = self.scpi_send(":OAMW 0x%02x%02x 0x%04x"%(inst, reg, value))
@@ -109,11 +351,7 @@ class SCPIAgent(C88xxAgentBase):
             return None;
 
     def get_ana(self, reg, dst = None):
-        ret = self.scpi_send(":ANAR 0x%04x"%(reg))
-        if ret :
-            return int(ret, 16)
-        else:
-            return None;
+        return self._parse_hex(self.scpi_send(":ANAR 0x%04x"%(reg)))
 
     def set_ana(self, reg, value, dst = None):
         ret = self.scpi_send(":ANAW 0x%04x 0x%04x"%(reg, value))
@@ -122,12 +360,25 @@ class SCPIAgent(C88xxAgentBase):
         else:
             return None;
 
+    def get_oam_many(self, regs, dst = None):
+        cmds = [":OAMR 0x%02x%02x" % (inst, reg) for inst, reg in regs]
+        return map(self._parse_hex, self.scpi_send_many(cmds))
+
+    def set_oam_many(self, items, dst = None):
+        cmds = [":OAMW 0x%02x%02x 0x%04x" % (inst, reg, value)
+                for inst, reg, value in items]
+        return self.scpi_send_many(cmds)
+
+    def get_ana_many(self, regs, dst = None):
+        cmds = [":ANAR 0x%04x" % (reg) for reg in regs]
+        return map(self._parse_hex, self.scpi_send_many(cmds))
+
+    def set_ana_many(self, items, dst = None):
+        cmds = [":ANAW 0x%04x 0x%04x" % (reg, value) for reg, value in items]
+        return self.scpi_send_many(cmds)
+
     def get_tuner(self, reg):
-        ret = self.scpi_send(":TUNR 0x%02x"%(reg))
-        if ret :
-            return int(ret, 16)
-        else:
-            return None;
+        return self._parse_hex(self.scpi_send(":TUNR 0x%02x"%(reg)))
 
     def set_tuner(self, reg, data):
         ret = self.scpi_send(":TUNW 0x%02x 0x%02x"%(reg, data))
@@ -144,6 +395,11 @@ class SCPIAgent(C88xxAgentBase):
             return None
 
     def dump_dbgc(self, samples = 2048, dst = None):
+        # a long dump, every chunk yields to the interactive commands
+        with priority(PRIO_BULK):
+            return self.__dump_dbgc(samples)
+
+    def __dump_dbgc(self, samples):
         wait_times = 3
         while (wait_times >= 0):
             ret = self.scpi_send(":DBGC:STAT?")
@@ -158,32 +414,79 @@ class SCPIAgent(C88xxAgentBase):
             if wait_times == 0:
                 return None
 
+        if self.block_dump is not False:
+            data = self.__dump_block(samples)
+            if data is not None:
+                return data
+
+        data = self.__dump_chunks(samples)
+        if self.block_dump is None and len(data):
+            # answers :DBGC:DUMP but not the block query, don't wait for it again
+            self.block_dump = False
+        return data
+
+    @staticmethod
+    def _parse_block(ret):
+        '''
+        IEEE 488.2 definite length block: #<n><len><data>
+        return data, or None if ret is not a block
+        '''
+        if not ret or ret[0] != "#" or not ret[1:2].isdigit():
+            return None
+        n = int(ret[1])
+        length = int(ret[2:2 + n] or 0)
+        if len(ret) < 2 + n + length:
+            return None
+        return buffer(ret, 2 + n, length)
+
+    def __dump_block(self, samples):
+        '''
+        the whole capture in one binary block of big endian uint32
+        '''
+        # the device reads out the whole capture before replying,
+        # 1 ms more per KiB of it on top of the normal timeout
+        timeout = self.timeout + samples * 4 / 1024.0 * 0.001
+        # probe once while the support is unknown, a device
+        # ignoring the query must not cost every retransmit
+        retry = 0 if self.block_dump is None else None
+        ret = self.scpi_send(":DBGC:DATA? %d" % samples, timeout, retry)
+        if ret is None:
+            return None # timeout, see __dump_dbgc
+        block = self._parse_block(ret)
+        if block is None:
+            if self.block_dump is None:
+                self.block_dump = False # error reply, chunk by chunk
+            return None
+        self.block_dump = True
+        return np.frombuffer(block, ">u4")
+
+    def __dump_chunks(self, samples):
+        '''
+        :DBGC:DUMP <addr> replies a uint32 length and `length` uint32
+        '''
         start_addr = 0
-        data = []
+        chunks = []
         while True:
             d = self.scpi_send(":DBGC:DUMP 0x%x" %(start_addr))
             if d is None:
                 break
 
-            d = self.str2arr(d)
-
-            l = int(''.join(map(lambda x:"%02x"%x, d[0:4])), 16)
-            print("--->", start_addr, l)
-
+            d = self._parse_block(d) or d
+            if len(d) < 4:
+                break
+            l = int(min(np.frombuffer(d, ">u4", 1)[0], len(d) / 4 - 1))
             if l == 0:
                 break
 
             start_addr += l
-
-            for x in range(0, l*4, 4):
-                k = int(''.join(map(lambda x:"%02x"%x, d[x+4:x+8])), 16)
-                data.append(k)
+            chunks.append(np.frombuffer(d, ">u4", l, 4))
 
             if start_addr >= samples:
                 break
 
-        print("total len ->", len(data))
-        return data
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate(chunks) if chunks else np.zeros(0, ">u4")
 
     def list_resource(self):
         return self.net.list_resource()
@@ -0,0 +1,321 @@
+import math
+import time
+import random
+import threading
+import numpy as np
+from c88xx_agent_base import C88xxAgentBase
+from completion_poller import CompletionPoller
+
+'''
+# Usage: SimAgent
+
+    # an in-process C88xx, no hardware needed
+    agent = C88xxAgentBase.get_agent("sim://sim0")
+
+    # 2ms +- 0.5ms per request, reproducible captures
+    agent = C88xxAgentBase.get_agent("sim://sim0?latency=0.002&jitter=0.0005&seed=1")
+
+    # URI options
+    latency:    sec per request
+    jitter:     sec, added to latency, uniform in [0, jitter)
+    window:     requests in flight for the *_many calls
+    tuner:      sec the tuner handshake(0x74) stays busy
+    seed:       random seed of jitter & captures
+    tone:       ADC tone frequency, cycles per sample
+    amp:        ADC tone amplitude, LSB
+    noise:      ADC noise rms, LSB
+'''
+
+# debug core capture point, see analyzer/c88xx_debugcore.py
+TP_RX_ADC   = 1  << 24
+TP_RX_RFTFR = 16 << 24
+
+@C88xxAgentBase.register("sim")
+class SimAgent(C88xxAgentBase):
+    # {(inst, reg): value}
+    oam_default = {
+        (0x7e, 0x74): 0xf100,   # tuner handshake idle
+        (0x7e, 0x75): 0x0000,
+        (0x7e, 0x85): 0x0024,   # agc
+        (0x7e, 0x8a): 0x0000,
+        (0x7e, 0xdc): 0x0000,   # agc setting, auto
+        (0x7e, 0xe1): 0x1006,
+        (0x7e, 0xf9): 0x1000,   # fc n = 8
+        (0x7e, 0xfd): 0x8800,   # probe
+    }
+    # {reg: value}, PLL 1600MHz, ADC 200MHz, BW n = 8
+    ana_default = {
+        0x08: 0x01a0,
+        0x13: 0x0100,
+        0x15: 0x0006,
+    }
+    # {reg: value}
+    tuner_default = {
+        0x00: 0xac,
+        0x01: 0x50,
+        0x02: 0x74,
+        0x03: 0x00,
+        0x04: 0x80,
+    }
+
+    # OFDM symbol of the FFT-out capture
+    N = 1024
+    CP = 64
+    start_data = 14
+    last_data = 1008
+
+    def __init__(self):
+        self.latency = 0
+        self.jitter = 0
+        self.window = 8
+        self.tuner_busy = 0
+        self.tone = 0.05
+        self.amp = 200
+        self.noise = 8
+        self._rand = random.Random()
+        self._lock = threading.Lock()
+        self._tuner_lock = threading.RLock() # the 0x74/0x75 handshake
+        self._tuner_poller = CompletionPoller()
+        self._opened = False
+        self.reset()
+
+    def reset(self):
+        '''
+        power on: every register back to default
+        '''
+        self.oam = dict(self.oam_default)
+        self.ana = dict(self.ana_default)
+        self.tuner = dict(self.tuner_default)
+        self._tuner_done = 0
+        self._dbgc = None
+
+    # ------------------------------------------------------
+    # simulation
+    # ------------------------------------------------------
+    def _delay(self, requests = 1):
+        '''
+        wait as `requests` round trips, `window` of them overlap
+        '''
+        rounds = (requests + self.window - 1) / self.window
+        for i in range(rounds):
+            t = self.latency
+            if self.jitter:
+                t += self._rand.uniform(0, self.jitter)
+            if t > 0:
+                time.sleep(t)
+
+    def _write_oam(self, inst, reg, value):
+        self.oam[(inst, reg)] = value & 0xffff
+        if (inst, reg) != (0x7e, 0x74):
+            return
+
+        # tuner handshake: 0x75 = addr << 8 | data
+        addr = (self.oam[(0x7e, 0x75)] >> 8) & 0xff
+        data = self.oam[(0x7e, 0x75)] & 0xff
+        if value == 0xf001:
+            self.oam[(0x7e, 0x75)] = self.tuner.get(addr, 0)
+        elif value == 0xf000:
+            self.tuner[addr] = data
+        else:
+            return
+        self._tuner_done = time.time() + self.tuner_busy
+
+    def _read_oam(self, inst, reg):
+        value = self.oam.get((inst, reg), 0)
+        if (inst, reg) == (0x7e, 0x74) and value in (0xf000, 0xf001):
+            if time.time() < self._tuner_done:
+                return value     # still busy
+            value |= 0x0100      # done
+            self.oam[(inst, reg)] = value
+        return value
+
+    def _gen_adc(self, samples):
+        '''
+        tone + gaussian noise, in the ADC raw format of
+        C88xxAnalyzer.adc_data_transform()
+        '''
+        phase = self._rand.uniform(0, 2 * math.pi)
+        data = []
+        for i in range(samples):
+            x = self.amp * math.sin(2 * math.pi * self.tone * i + phase)
+            x = int(round(x + self._rand.gauss(0, self.noise)))
+            x = min(max(x, -0x1ff), 0x1ff)
+            if x >= 0:
+                data.append(x << 1)
+            else:
+                data.append((x + 0x400) << 1)
+        return data
+
+    def _gen_channel(self):
+        '''
+        slowly varying channel response, [complex] * N
+        '''
+        ripple = self._rand.uniform(0.05, 0.2)
+        delay = self._rand.uniform(0, 4)
+        return [0.25 * (1 + ripple * math.cos(2 * math.pi * 3 * k / self.N)) *
+                complex(math.cos(2 * math.pi * delay * k / self.N),
+                        -math.sin(2 * math.pi * delay * k / self.N))
+                for k in range(self.N)]
+
+    def _gen_fftout(self, samples):
+        '''
+        FFT-out frames: (I << 16) | (Q << 1) | data_valid, I & Q are 16.15,
+        every symbol is CP clocks of idle followed by N valid carriers,
+        pilots carry the channel, data carriers QPSK
+        '''
+        H = self._gen_channel()
+        pilot = set(range(14) + range(19, self.N - 9, 12) + range(self.N - 15, self.N))
+        qpsk = [complex(x, y) / math.sqrt(2) for x in (-1, 1) for y in (-1, 1)]
+
+        def word(value, dv):
+            i = int(round(value.real * 2 ** 15)) & 0xffff
+            q = int(round(value.imag * 2 ** 15)) & 0x7fff
+            return (i << 16) | (q << 1) | dv
+
+        data = []
+        # trigger falls anywhere in a symbol
+        offset = self._rand.randrange(self.N + self.CP)
+        while len(data) < samples + offset:
+            data.extend([0] * self.CP)
+            for k in range(self.N):
+                if k < self.start_data or k > self.last_data:
+                    value = 0
+                elif k in pilot:
+                    value = H[k]
+                else:
+                    value = H[k] * self._rand.choice(qpsk)
+                data.append(word(value, 1))
+        return data[offset:offset + samples]
+
+    def _gen_capture(self, samples):
+        cs, tr_event, tp, tr_mode = self._dbgc
+        if tp & TP_RX_RFTFR:
+            return self._gen_fftout(samples)
+        if tp & TP_RX_ADC:
+            return self._gen_adc(samples)
+        return [self._rand.getrandbits(32) for i in range(samples)]
+
+    # ======================================================
+    # implement interface
+    # ======================================================
+    def open(self, uri):
+        # URI: sim://name?opt=value&opt=value
+        path, _, query = uri.partition("://")[-1].partition("?")
+        opts = dict(kv.partition("=")[::2] for kv in query.split("&") if kv)
+        try:
+            self.latency = float(opts.get("latency", 0))
+            self.jitter = float(opts.get("jitter", 0))
+            self.window = max(int(opts.get("window", 8)), 1)
+            self.tuner_busy = float(opts.get("tuner", 0))
+            self.tone = float(opts.get("tone", self.tone))
+            self.amp = float(opts.get("amp", self.amp))
+            self.noise = float(opts.get("noise", self.noise))
+            if "seed" in opts:
+                self._rand.seed(int(opts["seed"]))
+        except ValueError, e:
+            raise self.AgentOpenException("bad sim option: %s" % e)
+        self.reset()
+        self._opened = True
+
+    def close(self):
+        self._opened = False
+
+    def get_oam(self, inst, reg, dst = None):
+        self._delay()
+        with self._lock:
+            return self._read_oam(inst & 0xff, reg & 0xff)
+
+    def set_oam(self, inst, reg, value, dst = None):
+        self._delay()
+        with self._lock:
+            self._write_oam(inst & 0xff, reg & 0xff, value)
+        return True
+
+    def get_ana(self, reg, dst = None):
+        self._delay()
+        with self._lock:
+            return self.ana.get(reg & 0xff, 0)
+
+    def set_ana(self, reg, value, dst = None):
+        self._delay()
+        with self._lock:
+            self.ana[reg & 0xff] = value & 0xffff
+        return True
+
+    def get_oam_many(self, regs, dst = None):
+        self._delay(len(regs))
+        with self._lock:
+            return [self._read_oam(inst & 0xff, reg & 0xff) for inst, reg in regs]
+
+    def set_oam_many(self, items, dst = None):
+        self._delay(len(items))
+        with self._lock:
+            for inst, reg, value in items:
+                self._write_oam(inst & 0xff, reg & 0xff, value)
+        return [True] * len(items)
+
+    def get_ana_many(self, regs, dst = None):
+        self._delay(len(regs))
+        with self._lock:
+            return [self.ana.get(reg & 0xff, 0) for reg in regs]
+
+    def set_ana_many(self, items, dst = None):
+        self._delay(len(items))
+        with self._lock:
+            for reg, value in items:
+                self.ana[reg & 0xff] = value & 0xffff
+        return [True] * len(items)
+
+    def __tuner_cfg(self, rw, addr, data = 0):
+        # same handshake as MMPAgent, every step costs a round trip
+        with self._tuner_lock:
+            return self.__tuner_handshake(rw, addr, data)
+
+    def __tuner_handshake(self, rw, addr, data):
+        o74_req = 0xf001 if rw == "read" else 0xf000
+        self.set_oam(0x7e, 0x75, (addr & 0xff) << 8 | data & 0xff)
+        start = time.time()
+        self.set_oam(0x7e, 0x74, o74_req)
+        last = polled = 0
+        for wait in self._tuner_poller.waits(None, time.time() - start):
+            if self.get_oam(0x7e, 0x74) == o74_req | 0x0100: break
+            last = polled
+            time.sleep(wait)
+            polled = time.time() - start
+        else:
+            print("tuner: error in get 0x74")
+            return None
+        self._tuner_poller.learn(None, (last + polled) / 2)
+        return self.get_oam(0x7e, 0x75)
+
+    def get_tuner(self, reg, dst = None):
+        return self.__tuner_cfg("read", reg)
+
+    def set_tuner(self, reg, data, dst = None):
+        return self.__tuner_cfg("write", reg, data)
+
+    def setup_dbgc(self, cs, tr_event, tp, tr_mode, dst = None):
+        self._delay()
+        self._dbgc = (cs, tr_event, tp, tr_mode)
+        return True
+
+    def dump_dbgc(self, samples = 2048, dst = None):
+        if self._dbgc is None:
+            return None
+        # status + one request per 128 samples + release
+        self._delay()
+        for i in range((samples + 127) / 128 + 1):
+            self._delay()
+        with self._lock:
+            return np.array(self._gen_capture(samples), ">u4")
+
+    def list_resource(self):
+        return {"sim0": "simulated C88xx device"}
+
+if __name__ == "__main__":
+    sim = C88xxAgentBase.get_agent("sim://sim0?seed=1")
+    print(sim.get_oam(0x7e, 0xfd))
+    print(sim.set_tuner(0x03, 0x5a))
+    print("TUNER[%02x] = 0x%02x" % (0x03, sim.get_tuner(0x03)))
+    sim.setup_dbgc(0, 0, TP_RX_ADC | 0x7ff, 0)
+    print(sim.dump_dbgc(2048)[:8])
@@ -0,0 +1,236 @@
+import unittest
+import sys
+import time
+import random
+import threading
+import Queue
+
+sys.path.append("../")
+import mmp_agent
+from mmp_agent import MMPAgent, mac2arr
+from mmp_fleet import MMPFleet
+from c88xx_agent_base import C88xxAgentBase
+from cached_agent import CachedAgent
+import sim_agent
+
+class FakeWire(object):
+    '''
+    devices answering MMP on one interface, in process
+    '''
+    def __init__(self, loss = 0.0, seed = 1):
+        self.devices = {} # mac: {(inst, reg): value}
+        self.loss = loss
+        self.lose_once = set() # (mmptype, payload[0], payload[1])
+        self.late = (0, 0.0) # every n-th respond late by sec, a busy CPU
+        self.random = random.Random(seed)
+        self._count = 0
+
+    def add_device(self, mac):
+        self.devices[mac] = {}
+
+    def answer(self, frame):
+        '''
+        return the respond frame, None if lost or nobody answers
+        '''
+        frame = bytearray(frame)
+        dst = bytes(frame[0:6])
+        oam = self.devices.get(dst, None)
+        if oam is None or self.random.random() < self.loss:
+            return None
+        mmptype, p = frame[16], frame[22:]
+        if (mmptype, p[0], p[1]) in self.lose_once:
+            self.lose_once.remove((mmptype, p[0], p[1]))
+            return None
+        if mmptype == 0xa0:
+            value = oam.get((p[0], p[1]), p[1])
+            payload = [0, value >> 8, value & 0xff]
+        elif mmptype == 0xa2:
+            oam[(p[0], p[1])] = p[2] << 8 | p[3]
+            payload = [0]
+        elif mmptype == 0xb8:
+            if p[0] == 0xff:
+                payload = [0] # done
+            else:
+                payload = [0] + [(p[0] * 128 + k / 4) >> (8 * (3 - k % 4)) & 0xff
+                                 for k in range(512)]
+        else:
+            return None
+        respond = frame[6:12] + frame[0:6] + frame[12:16] + bytearray([mmptype + 1])
+        return bytes(respond + frame[17:22] + bytearray(payload))
+
+    def lateness(self):
+        every, sec = self.late
+        self._count += 1
+        if every and self._count % every == 0:
+            return sec
+        return 0.0
+
+class FakeNet(object):
+    '''
+    stands for NetRaw, on a FakeWire of `wires`
+    '''
+    wires = {} # dev: FakeWire
+
+    def open(self, dev, proto):
+        self.wire = self.wires[dev]
+        self.src_mac = [0x02, 0, 0, 0, 0, 0xfe]
+        self._rx = Queue.Queue()
+        self._filter = None
+
+    def set_filter(self, dev_mac = None, drain = True):
+        self._filter = dev_mac and bytes(bytearray(dev_mac))
+
+    def close(self):
+        pass
+
+    def send(self, sdata):
+        respond = self.wire.answer(sdata)
+        if not respond or self._filter not in (None, respond[6:12]):
+            return
+        late = self.wire.lateness()
+        if late:
+            threading.Timer(late, self._rx.put, [respond]).start()
+        else:
+            self._rx.put(respond)
+
+    def recv(self, nbytes, timeout):
+        try:
+            return self._rx.get(True, timeout)
+        except Queue.Empty:
+            return []
+
+    def get_hw_addr(self):
+        return self.src_mac
+
+    @staticmethod
+    def list_resource():
+        return {}
+
+def run_all(works, timeout):
+    '''
+    run every work in its own thread
+    return the results, None for the work not done in `timeout`
+    '''
+    results = [None] * len(works)
+    def run(i):
+        results[i] = works[i]()
+    threads = [threading.Thread(target = run, args = (i, )) for i in range(len(works))]
+    for t in threads:
+        t.daemon = True # a deadlocked one must not hang the test
+        t.start()
+    deadline = time.time() + timeout
+    for t in threads:
+        t.join(max(deadline - time.time(), 0))
+    return results
+
+class TestMMPPipeline(unittest.TestCase):
+    mac = "02:00:00:00:00:01"
+
+    def setUp(self):
+        self.net_raw = mmp_agent.NetRaw
+        mmp_agent.NetRaw = FakeNet
+        FakeNet.wires["fake0"] = FakeWire()
+        FakeNet.wires["fake0"].add_device(bytes(bytearray(mac2arr(self.mac))))
+
+        self.agent = MMPAgent()
+        self.agent.open("mmp://fake0/%s" % self.mac)
+        self.agent.set_pipeline(True, 8)
+
+    def tearDown(self):
+        self.agent.close()
+        mmp_agent.NetRaw = self.net_raw
+
+    def test_bulk_callers_share_the_window(self):
+        # each one wants more slots than half of the window
+        regs = [(0x7e, i) for i in range(64)]
+        works = [lambda: self.agent.get_oam_many(regs),
+                 lambda: self.agent.get_oam_many(regs),
+                 lambda: self.agent.dump_dbgc(2048),
+                 lambda: self.agent.dump_dbgc(2048)]
+        res = run_all(works, 20)
+
+        self.assertEqual(res[0], [i for inst, i in regs])
+        self.assertEqual(res[1], [i for inst, i in regs])
+        for dump in res[2:]:
+            self.assertIsNotNone(dump)
+            self.assertEqual(list(dump), range(2048))
+
+    def test_no_spurious_retransmit(self):
+        FakeNet.wires["fake0"].late = (32, 0.06)
+        regs = [(0x7e, i & 0xff) for i in range(256)]
+        res = run_all([lambda: self.agent.get_oam_many(regs)] * 4, 20)
+
+        self.assertEqual(res, [[i for inst, i in regs]] * 4)
+        snap = self.agent.stats.snapshot()
+        self.assertEqual(snap["stray"], 0)
+        self.assertEqual(snap["commands"]["get_oam"]["retries"], 0)
+
+    def test_lost_respond_blocks_nobody(self):
+        FakeNet.wires["fake0"].lose_once.add((0xa0, 0x7e, 0))
+        self.agent.cmd_timeout["get_oam"] = 0.5 # plenty for the others
+        order = []
+        res = self.agent.mmp_send_many(
+                [("get_oam", [0x7e, i]) for i in range(32)], order = order)
+
+        self.assertEqual(map(MMPAgent._parse_u16, res), range(32))
+        # the others went on while reg 0 waited for its retransmit
+        self.assertEqual(order, range(1, 32) + [0])
+
+    def test_dump_on_lossy_wire(self):
+        FakeNet.wires["fake0"].loss = 0.2
+        dump = run_all([lambda: self.agent.dump_dbgc(2048)], 60)[0]
+
+        self.assertIsNotNone(dump)
+        self.assertEqual(list(dump), range(2048))
+
+class TestMMPFleet(unittest.TestCase):
+    macs = ["02:00:00:00:00:01", "02:00:00:00:00:02"]
+
+    def setUp(self):
+        self.net_raw = mmp_agent.NetRaw
+        mmp_agent.NetRaw = FakeNet
+        FakeNet.wires["fake0"] = FakeWire()
+        for mac in self.macs:
+            FakeNet.wires["fake0"].add_device(bytes(bytearray(mac2arr(mac))))
+
+        self.devices = [MMPFleet.get_device("fake0", mac) for mac in self.macs]
+
+    def tearDown(self):
+        for device in self.devices:
+            device.close()
+        mmp_agent.NetRaw = self.net_raw
+
+    def test_devices_dump_at_once(self):
+        works = []
+        for device in self.devices:
+            works.append(lambda device = device: device.dump_dbgc(8192))
+            works.append(lambda device = device: device.get_oam_many([(0x7e, 0x10)] * 64))
+        res = run_all(works, 20)
+
+        self.assertEqual(MMPFleet.list_links(), {"fake0": 2})
+        for dump, regs in zip(res[0::2], res[1::2]):
+            self.assertIsNotNone(dump)
+            self.assertEqual(list(dump), range(8192))
+            self.assertEqual(regs, [0x10] * 64)
+
+class TestAgentURI(unittest.TestCase):
+    def test_cache_option(self):
+        agent = C88xxAgentBase.get_agent("sim://sim0?seed=1&cache=0.5", shared = False)
+        try:
+            self.assertIsInstance(agent, CachedAgent)
+            self.assertEqual(agent.ttl["oam"], 0.5)
+            self.assertEqual(agent.get_oam(0x7e, 0x10), agent.get_oam(0x7e, 0x10))
+            self.assertEqual((agent.hits, agent.misses), (1, 1))
+            self.assertTrue(agent.ping())
+        finally:
+            agent.close()
+
+        agent = C88xxAgentBase.get_agent("sim://sim0?cache", shared = False)
+        self.assertEqual(agent.ttl, CachedAgent.ttl)
+        agent.close()
+        agent = C88xxAgentBase.get_agent("sim://sim0", shared = False)
+        self.assertNotIsInstance(agent, CachedAgent)
+        agent.close()
+
+if __name__ == '__main__':
+    unittest.main()
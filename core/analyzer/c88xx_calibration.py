@@ -3,7 +3,7 @@ import time
 
 import platform
 from c88xx_analyzer_base import C88xxAnalyzerBase
-from c89xx_tuner import PAInfo
+from c89xx_tuner import PAInfo, C89xxTuner
 
 # BACKEND pyvisa-py
 _PYVISA_BACKEND = "@py"
@@ -290,10 +290,17 @@ class C88xxCalibrator(C88xxAnalyzerBase, PAInfo):
         e1 |= 0x0060
         agent.set_oam(0x7e, 0xe1, e1)
 
+    def __tuner(self):
+        # the shared tuner analyzer, a write through it keeps its shadow right
+        tuner = self.get_analyzer("tuner")
+        if tuner is None or tuner.agent is not self.agent:
+            tuner = C89xxTuner(self.agent)
+        return tuner
+
     def __set_pa(self, pa_reg):
         reg = (pa_reg >> 8) & 0xff
         data = pa_reg & 0xff
-        return self.agent.set_tuner(reg, data)
+        return self.__tuner().tuner_set(reg, data)
 
     # ------------------------------------------------------
     # public method
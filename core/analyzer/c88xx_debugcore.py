@@ -2,6 +2,8 @@ import math
 import numpy as np
 from functools import partial
 from c88xx_analyzer_base import C88xxAnalyzerBase
+from c88xx_frequency import C88xxFrequency
+from spectrum import Spectrum
 
 # ==================================
 # Constant
@@ -222,9 +224,12 @@ class C88xxAnalyzer(C88xxAnalyzerBase):
         self.last_amp = 0
         self.adc_input_table = [60,65,70,75,80,85,90,95]
         self.adc_output_table = [8.0, 12.7,21.4,37.0,66.0,117.0,205.0,358.0]
-        self.dbgc_data_average = 0
+        self.dbgc_data_average = 0      # rms(ac) of the last adc capture
         self.dbgc_data_db_average = 0
+        self.dbgc_data_mean = 0
+        self.dbgc_data_peak = 0
         self.dbgc_last_data = []
+        self.spectrum = Spectrum("hann")    # psd() running average
 
 
         self.formater = {
@@ -263,9 +268,8 @@ class C88xxAnalyzer(C88xxAnalyzerBase):
             return af*(self.adc_input_table[index+1]-self.adc_input_table[index])+ self.adc_input_table[index]
 
     def get_agc_amp(self):
-        agc_set = self.agent.get_oam( 0x7e, 0xdc)
-        agc = self.agent.get_oam(0x7e, 0x85)
-        gd = self.agent.get_oam(0x7e, 0x8a)
+        agc_set, agc, gd = self.agent.get_oam_many(
+                [(0x7e, 0xdc), (0x7e, 0x85), (0x7e, 0x8a)])
         agc_1 = 0
         agc_2 = 0
         if agc != None:
@@ -288,20 +292,57 @@ class C88xxAnalyzer(C88xxAnalyzerBase):
             ret_db = ret_db + self.last_amp
         return ret_db
 
+    @staticmethod
+    def adc_decode(data):
+        '''
+        raw ADC words -> int16 array, the dump itself is not modified
+        '''
+        raw = np.asarray(data)
+        neg = raw > 0x400
+        adc = (np.where(neg, raw & 0x7fe, raw) >> 1).astype(np.int16)
+        adc[neg] -= 0x400
+        return adc
+
+    @staticmethod
+    def adc_stats(adc):
+        '''
+        return (mean, rms(ac), peak) of an adc_decode() array
+        '''
+        n = len(adc)
+        s1 = int(adc.sum(dtype = np.int64))
+        s2 = int(np.dot(adc.astype(np.int64), adc))
+        # integer division as ever, same values as the list version
+        rms = math.sqrt((s2 - s1 * s1 / n) / n)
+        peak = int(np.abs(adc).max())
+        return s1 / float(n), rms, peak
+
     def adc_data_transform(self, data):
-        for i in range(len(data)):
-            if data[i] > 0x400:
-                data[i] = data[i] & 0x7fe
-                data[i] = data[i] >> 1
-                data[i] = data[i] - 0x400
-            else:
-                data[i] = data[i] >> 1
-        if len(data) > 0:
-            self.dbgc_data_average = math.sqrt((sum(map(lambda x:x *x,data)) - sum(data) * sum(data) / len(data))/len(data))
-            self.dbgc_data_db_average = self.agc_read_avg_2_dB(self.dbgc_data_average)
-        return data
+        adc = self.adc_decode(data)
+        if len(adc) > 0:
+            mean, rms, peak = self.adc_stats(adc)
+            self.dbgc_data_mean = mean
+            self.dbgc_data_peak = peak
+            self.dbgc_data_average = rms
+            self.dbgc_data_db_average = self.agc_read_avg_2_dB(rms)
+        return adc
 
     # ---- for fft -----------
+    # FFT-out word: I(16.15) << 16 | Q << 1 | data valid
+    iq_scale = np.array([2.0 ** -15, 2.0 ** -16], np.float32)
+
+    @classmethod
+    def fftout_decode(cls, data):
+        '''
+        rx_fftout / rx_fftout_error words -> complex64 array I + jQ,
+        the data valid bit stays the half lsb of Q as channel_test2.m reads it
+        '''
+        words = np.ascontiguousarray(data, ">u4")
+        # no copy of a dump: [[I, Q << 1 | dv], ...]
+        iq = words.view(">i2").reshape(-1, 2)
+        ret = np.empty(len(words), np.complex64)
+        np.multiply(iq, cls.iq_scale, out = ret.view(np.float32).reshape(-1, 2))
+        return ret
+
     F = [
         [-0.339745580000000+0.237908360000000j,0.274224600000000-0.117975590000000j,1.00000000000000-0.205321280000000j,0.0566232880000000+0.0847366050000000j,0.00930407350000000-0.000809176510000000j,0.000187633220000000-0.00184485030000000j],
         [-0.362672940000000+0.382311160000000j,0.175071660000000-0.121615930000000j,1.00000000000000-0.426762800000000j,0.170290520000000+0.168751330000000j,0.0176702590000000-0.00522702820000000j,-0.000352281210000000-0.00352889540000000j],
@@ -376,258 +417,262 @@ class C88xxAnalyzer(C88xxAnalyzerBase):
         [0.000187633220000000+0.00184485030000000j,0.00930407350000000+0.000809176510000000j,0.0566232880000000-0.0847366050000000j,1.00000000000000+0.205321280000000j,0.274224610000000+0.117975590000000j,-0.339745580000000-0.237908360000000j]
         ]
 
-    def floor(self, data):
-        if str(type(data)).find("complex") == -1:
-            return np.floor(data)
-        else:
-            return complex(np.floor(data.real), np.floor(data.imag))
+    # ori-name: channel_test2_tep, translated from channel_test2.m
+    # OFDM symbol of the FFT-out capture
+    N = 1024
+    Q = 12 * 3          # equalizer delay
+    start_data = 14
+    last_data = 1008
+    nseg = 41 * (N / 512)
+    pilot = np.array(range(14) + range(19, N - 10 + 1, 12) + range(N - 15, N))
+    _eq_taps = {}       # {pilots received: equalizer schedule}
+    _eq_table = None    # F quantized & saturated, complex array
+
+    @classmethod
+    def __equalizer_table(cls):
+        '''
+        F floored to 2**-14, real & imag saturated to 1 - 2**-14,
+        built once on first use
+        '''
+        if cls._eq_table is None:
+            F = cls.__floor(np.array(cls.F, complex), 14)
+            for part in (F.real, F.imag):
+                full = abs(part) >= 1
+                part[full] = (1 - 2 ** -14) * np.sign(part[full])
+            cls._eq_table = F
+        return cls._eq_table
+
+    @staticmethod
+    def __floor(x, bits):
+        '''
+        x floored to a multiple of 2**-bits, real & imag apart
+        '''
+        scale = 2.0 ** bits
+        if not np.iscomplexobj(x):
+            return np.floor(x * scale) / scale
+        ret = np.empty_like(x)
+        ret.real = np.floor(x.real * scale) / scale
+        ret.imag = np.floor(x.imag * scale) / scale
+        return ret
 
-    # ori-name: channel_test2_tep
-    # return None or [....]
+    def __channel_input(self, xdata):
+        '''
+        return (carrier, dv), N idle samples ahead & one behind the capture,
+        carrier: fftout_decode(), dv: data valid
+        '''
+        words = np.ascontiguousarray(xdata, ">u4")
+        carrier = np.zeros(self.N + len(words) + 1, complex)
+        carrier[self.N:-1] = self.fftout_decode(words)
+        dv = np.zeros(len(carrier), np.int8)
+        dv[self.N:-1] = words & 1
+        return carrier, dv
+
+    def __channel_symbols(self, dv):
+        '''
+        drop a broken first & last symbol from dv in place
+        return [index of the first carrier of every symbol]
+        '''
+        edge = np.diff(np.concatenate(([0], dv)))
+        rise = np.flatnonzero(edge == 1)
+        fall = np.flatnonzero(edge == -1)
+        if fall[0] - rise[0] != self.N:
+            dv[rise[0]:fall[0] + 1] = 0
+        if len(dv) - rise[-1] < self.N:
+            dv[rise[-1]:] = 0
+        return np.flatnonzero(np.diff(dv) == 1) + 1
+
+    def __channel_pilot(self, carrier, dv, symbols):
+        '''
+        zero the pilots out of the data band of carrier in place
+        return pilots received, a prefix of self.pilot
+        '''
+        valid = np.flatnonzero(dv)
+        if len(valid) == 0:
+            raise ValueError("no data valid")
+        # carrier index in its symbol
+        kk = valid - symbols[np.searchsorted(symbols, valid, "right") - 1]
+        if kk.max() >= self.N:
+            raise ValueError("symbol longer than N")
+        guard = np.zeros(self.N, bool)
+        guard[self.pilot] = True
+        guard[self.start_data - 3:self.last_data + 3 + 1] = False
+        carrier[valid[guard[kk]]] = 0
+        return int(np.searchsorted(self.pilot, kk.max() + 1))
+
+    @classmethod
+    def __equalizer_taps(cls, pilots):
+        '''
+        run the equalizer of channel_test2.m on carrier indexes,
+        return (eq, taps, coef), the equalized carriers of a symbol:
+            H[eq[i]] = sum(Y[taps[i]] * coef[i]), Y[N] is 0
+            H[k] = Y[k] for the others
+        '''
+        taps = cls._eq_taps.get(pilots, None)
+        if taps is not None:
+            return taps
+
+        N, Q = cls.N, cls.Q
+        start, last = cls.start_data, cls.last_data + 3
+        fg_pilot_b = np.zeros(N + Q, bool)
+        fg_pilot_b[cls.pilot[:pilots]] = True
+
+        taps = np.empty((N, 6), int)
+        row = np.zeros(N, int)
+        direct = np.ones(N, bool)
+        index_filter = 1
+        vec = [N] * 6
+        buf = [N] * 6
+        cnt1 = 0
+        cnt_buf = 0
+        for k in range(N + Q):
+            cnt1 = cnt1 + 1
+            if k >= start - 3:
+                if k <= last and fg_pilot_b[k]:
+                    cnt_buf = cnt_buf + 1
+                    buf[cnt_buf - 1] = k
+                if (k > 256 and cnt1 == 12) or (k <= 256 and cnt_buf > 0):
+                    vec = vec[1:] + buf[:1]
+                    buf = buf[1:] + [N]
+                    cnt_buf = cnt_buf - 1
+                    cnt1 = 0
+            if k < start + Q:
+                direct[k] = True
+            elif k - Q > last - 3:
+                direct[k - Q] = True
+            else:
+                stx1 = 29
+                if index_filter > stx1:
+                    if index_filter < 6 + 12 * (cls.nseg - 2):
+                        index_tep = ((index_filter - stx1 - 1) % 12) + stx1 + 1
+                    else:
+                        index_tep = stx1 + 12 + index_filter - (6 + 12 * (cls.nseg - 2)) + 1
+                else:
+                    index_tep = index_filter
+                direct[k - Q] = fg_pilot_b[k - Q]
+                taps[k - Q] = vec
+                row[k - Q] = index_tep - 1
+                index_filter = index_filter + 1
+
+        eq = np.flatnonzero(~direct)
+        taps = cls._eq_taps[pilots] = (eq, taps[eq], cls.__equalizer_table()[row[eq]])
+        return taps
+
+    def __channel_estimate(self, carrier, symbols, pilots):
+        '''
+        return H of the whole capture, 1 out of the symbols
+        '''
+        N = self.N
+        if len(symbols) == 0 or symbols[-1] + N > len(carrier):
+            raise ValueError("symbol out of the capture")
+        eq, taps, coef = self.__equalizer_taps(pilots)
+
+        # Y: [symbol][carrier], a 0 carrier appended for the empty taps
+        Y = np.zeros((len(symbols), N + 1), complex)
+        Y[:, :N] = carrier[symbols[:, None] + np.arange(N)]
+        H = Y[:, :N].copy()
+        # every equalized carrier of every symbol at once
+        H[:, eq] = (Y[:, taps] * coef).sum(axis = 2)
+
+        Hout = np.ones(len(carrier), complex)
+        for start, h in zip(symbols, H):
+            Hout[start:start + N] = h
+        return Hout
+
+    def __channel_eye(self, Hout, carrier):
+        '''
+        return YA of the whole capture, Hout & carrier floored to 2**-11
+        '''
+        B = 8               # A_pilot[log2(P)], P = 2 ** (6 / 2)
+        A = self.__floor((Hout * Hout.conj()).real, 17)
+        YA = self.__floor(Hout.conj() * B * carrier, 13).real
+        return np.where(A == 0, 0, YA / np.where(A == 0, 1, A))
+
+    # return None or float array
     # kw["type"]
     #   1       format to eye diagram
     #   else    format to frequency response
     def channel_formater(self, xdata, **kw):
         ret_type = kw.get("type", 0)
-        '''translate matlib channel_test2.m'''
-        if (not xdata) or (xdata == []):
+        if xdata is None or len(xdata) == 0:
             return None
 
-        ret = None
-
         try:
-            fg_fftin = 0
-            tring = 0
-            fg_downst = 1
-            P = 6
-            fg_deinter = 0
-            cp = 64
-            NFFT = 1024
-            fg_DEMAP = 0
-            N = 1024
-            ldpcsize = 1824
-            if P == 6:
-                ldpcsize = 2736
-            JN = round(NFFT*912/1024*P/ldpcsize)
-            datain = [0]*1024
-            dvin = [0]*1024
-
-            for i in xdata:
-                xi = i>>16
-                xi = (xi >= 0x8000)*(- 0x10000) + xi
-                xq = i & 0xffff
-                xq = (xq >= 0x8000) * (- 0x10000) + xq
-                xq = xq/2.0
-                datain.append(complex(xi ,xq))
-                dvin.append(i&1)
-            datain.append(0)
-            dvin.append(0)
-
-            tep = []
-            tep_add = 0
-            for i in dvin:
-                tep.append(i-tep_add)
-                tep_add = i
-            tepp = [i for i in range(len(tep)) if tep[i] == 1]
-            teppx = [i for i in range(len(tep)) if tep[i] == -1]
-            if teppx[0] - tepp[0] != N:
-                i = tepp[0]
-                while(i <= teppx[0]):
-                    dvin[i] = 0
-                    i+=1
-            if(len(dvin) - tepp[-1]) < N:
-                i = tepp[-1]
-                while(i < len(dvin)):
-                    dvin[i] = 0
-                    i+=1
-
-            #FFT
-            l_fft = N+cp
-            fft_inj = datain
-            dv_inj = dvin
-
-            if len(dv_inj) < len(fft_inj):
-                dv_inj.extend([0]*(len(fft_inj)-len(dv_inj)))
-            else:
-                fft_inj.extend([0]*(len(dv_inj)-len(fft_inj))) 
-            fftout = []
-            for i in fft_inj:
-                fftout.append(i / (2.0**15)) #16.15
-            dvfft=dv_inj
-            P = 2**(P/2)
-            tep=[i for i in range(len(dvfft)) if dvfft[i] != 0]
-            fg_frame=[0]*len(dvfft)
-            i = tep[0]
-            while(i <= tep[-1]):
-                fg_frame[i] = 1
-                i+=1
-
-            c = [0]*10
-            c[0] = 1
-            c[3] = 1
-            reg = [0]*10
-            reg[0] = 1
-            index_pilot = range(14)
-            index_pilot.extend(range(19,N-10+1,12))
-            index_pilot.extend(range(N-15,N-1+1))
-            start_data=14
-            last_data=1008
-
-            fg_pilot=[0]*len(fftout)
-            fg_pilot_b=[0]*(len(fftout)+1)
-            pilot=fg_pilot
-            fftoutx=fftout
-            i = 1
-            ####
-            for k in range(2,len(fftout)+1):
-                if (dvfft[k-1-1]==0) & (dvfft[k-1]):
-                    i = 1
-                    reg = [0]*10
-                    reg[0] = 1
-                    kk = 0
-                if dvfft[k-1] == 1:
-                    temp_reg = 0
-                    for x in range(len(reg)):
-                        temp_reg += reg[x]*c[x]
-                    reg = reg[1:]
-                    reg.append(temp_reg & 1)
-                    pilot[k-1] = 2*(reg[0]==1)-1
-                    if kk == index_pilot[i-1]:
-                        if fg_fftin==0:
-                            fftoutx[k-1] = fftout[k-1]
-                        else:
-                            fftoutx[k-1] = fftout[k-1]/np.sign(pilot[k-1])
-                        if fg_fftin == 1:
-                            fftoutx[k-1] = fftoutx[k-1]/(1+1j)
-                        fg_pilot[k-1] = 1
-                        fg_pilot_b[kk+1-1] = 1
-                        if N == 1024:
-                            if (kk<(start_data -3)) | (kk > (last_data+3)):
-                                fftoutx[k-1] = 0
-                        else:
-                            if (kk<(start_data -3)) | (kk > (last_data+3)):
-                                fftoutx[k-1] = 0
-                        i += 1
-                    else:
-                        fftoutx[k-1] = fftout[k-1]
-                        fg_pilot[k-1] = 0
-                    kk += 1
-            ##end of pilot response
-            ##load F_1024_comp
-            start = start_data
-            last = last_data + 3
-            nseg = 41 * (N / 512)
-
-            F = []
-            for y in self.F:
-                a = []
-                for x in y:
-                    x1 = self.floor(x * (2**14))/(2.0**14)
-                    Fi = x1.imag
-                    Fi = Fi*(abs(Fi)<1)+(1 - (2**-14))*np.sign(Fi)*(abs(Fi)>=1)
-                    Fr = x1.real
-                    Fr = Fr*(abs(Fr)<1)+(1 - (2**-14))*np.sign(Fr)*(abs(Fr)>=1)
-                    a.append(complex(Fr, Fi))
-                F.append(a)
-
-
-            Hout = [1] * len(fftoutx)
-            for kk in range(1, len(fftoutx)):
-                if(dvfft[kk-1]==0)&(dvfft[kk]==1):
-                    Y = fftoutx[kk:kk+N]
-                    H = [0] * len(Y)
-                    index_filter = 1
-                    Q = 12*3
-                    vec = [0] * 6
-                    cnt1 = 0
-                    cnt_buf = 0
-                    buf = [0] * 6
-                    for k in range(N+Q):
-                        cnt1 = cnt1 + 1
-                        if (k >=(start -3)):
-                            if (k <=last):
-                                if(fg_pilot_b[k] == 1):
-                                    cnt_buf = cnt_buf + 1
-                                    buf[cnt_buf - 1] = Y[k]
-                            if k > 256:
-                                if cnt1 ==12:
-                                    vec = vec[1:]
-                                    vec.append(buf[0])
-                                    buf = buf[1:]
-                                    buf.append(0)
-                                    cnt_buf = cnt_buf - 1
-                                    cnt1 = 0
-                            elif cnt_buf > 0:
-                                vec = vec[1:]
-                                vec.append(buf[0])
-                                buf = buf[1:]
-                                buf.append(0)
-                                cnt_buf = cnt_buf - 1
-                                cnt1 = 0
-                        if ((k) < start + Q ):
-                            H[k] = Y[k]
-                        else:
-                            if (k-Q) > (last - 3):
-                                H[k-Q] = Y[k-Q]
-                            else:
-                                stx1 = 29
-                                if (index_filter > stx1):
-                                    if (index_filter < 6+12*(nseg-2)):
-                                        index_tep = ((index_filter-stx1-1)%12) + stx1 + 1
-                                    else:
-                                        index_tep = stx1+12+index_filter - (6 + 12 *(nseg -2)) + 1
-                                else:
-                                    index_tep = index_filter
-                                if fg_pilot_b[k - Q] == 1:
-                                    H[k - Q] = Y[k - Q]
-                                else:
-                                    H[k - Q] = 0
-                                    for x in range(len(vec)):
-                                        H[k - Q] += vec[x] * F[index_tep-1][x]
-                                index_filter = index_filter + 1
-                    for x in range(len(H)):
-                        Hout[kk + x] = H[x]
-
-            A_pilot = [1,2,4,8,16]
-            for x in range(len(Hout)):
-                Hout[x] = self.floor(Hout[x] * (2**11)) / (2.0**11)
-            for x in range(len(fftoutx)):
-                fftoutx[x] = self.floor(fftoutx[x] * (2**11)) / (2.0**11)
-            B = A_pilot[int(math.log(P,2))]
-            A = []
-            YA = []
-            for x in Hout:
-                y = (x * x.conjugate()).real
-                A.append(self.floor(y * (2**17))/(2.0 ** 17))
-                YA.append(x.conjugate()*B)
-            for x in range(len(YA)):
-                YA[x] = YA[x]* fftoutx[x]
-                YA[x] = self.floor(YA[x] * (2**13))/(2.0 ** 13)
-                if A[x] == 0:
-                    YA[x] = 0
-                else:
-                    YA[x] = (YA[x].real)/A[x]
-
-            if ret_type == 0:
-                ret = map(abs, Hout)
-            elif ret_type == 1:
-                ret = YA
-            else:
-                ret = map(abs, Hout)
-        except Exception, e:
+            carrier, dv = self.__channel_input(xdata)
+            symbols = self.__channel_symbols(dv)
+            pilots = self.__channel_pilot(carrier, dv, symbols)
+            Hout = self.__channel_estimate(carrier, symbols, pilots)
+        except (IndexError, ValueError), e:
             # print("Exception", e)
             return None
-        return ret
+
+        Hout = self.__floor(Hout, 11)
+        if ret_type == 1:
+            return self.__channel_eye(Hout, self.__floor(carrier, 11))
+        return np.abs(Hout)
+
+    # ---- spectrum ----------
+    adc_full_scale = 0x200      # LSB, peak of adc_decode()
 
     def fft(self, dump_info):
-        data = abs(np.fft.fft(dump_info))
-        return map(lambda x:20 * math.log(x,10) + self.last_amp, data)
+        '''
+        |FFT| in dB + AGC gain, every bin of the full length, see psd()
+        '''
+        data = np.abs(np.fft.fft(dump_info))
+        return Spectrum.to_db(data ** 2, offset = self.last_amp)
+
+    def adc_clock(self):
+        '''
+        MHz, None if the clock registers can not be read
+        '''
+        freq = C88xxFrequency(self.agent)
+        if not freq.get_online_frequency():
+            return None
+        return freq.get_adc_clock().get_val()
+
+    def psd(self, data, averages = 1, unit = "dBFS"):
+        '''
+        data:     capture, real(ADC) or complex
+        averages: captures in the running average of self.spectrum,
+                  1 for this capture alone
+        unit:     "dBFS", full scale sine at 0dB
+                  "dB",   LSB**2 + AGC gain, the scale of fft()
+        return (freq, dB array), freq in MHz of the ADC clock,
+        cycles per sample without a device
+        '''
+        if averages <= 1:
+            self.spectrum.reset()
+        self.spectrum.averages = averages
+        power = self.spectrum.add(data)
+        if unit == "dBFS":
+            db = Spectrum.to_db(power, self.adc_full_scale ** 2 / 2.0)
+        else:
+            db = Spectrum.to_db(power, offset = self.last_amp)
+        clock = self.agent and self.adc_clock()
+        return self.spectrum.freq(clock or 1.0), db
 
     # ==================================
     # Trigger Function
     # ==================================
-    # return [] or None
-    def trigger(self, dbgc_event, samples = None, formater = None):
+    # return uint32 array or None
+    def __dump(self, samples, progress):
+        if not progress:
+            info = self.agent.dump_dbgc(samples)
+            return None if info is None else np.asarray(info, ">u4")
+
+        info = np.zeros(samples, ">u4")
+        got = 0
+        for offset, words in self.agent.stream_dbgc(samples, progress):
+            n = min(len(words), samples - offset)
+            info[offset:offset + n] = words[:n]
+            got += n
+        if got < samples:
+            return None # chunk lost
+        return info
+
+    def trigger(self, dbgc_event, samples = None, formater = None, progress = None):
+        '''
+        progress: callback(chunks done, chunks total) of the dump
+        '''
         assert(isinstance(dbgc_event, C88xxDebugcoreEvent))
         tr_clock = dbgc_event._get_clock()
         tr_event = dbgc_event._get_event()
@@ -648,21 +693,21 @@ class C88xxAnalyzer(C88xxAnalyzerBase):
         if not rsp:
             return None # timeout
 
-        info = self.agent.dump_dbgc(samples or dbgc_event._get_max_size())
+        info = self.__dump(samples or dbgc_event._get_max_size(), progress)
 
         # e1 recover
         if set_e1:
             self.agent.set_oam(0x7e, 0xe1, e1_ori)
-        if not (info and formater):
+        if info is None or len(info) == 0 or not formater:
             return info
         return formater(info)
 
     # return [] or None
-    def trigger_func(self, func, points = None, pre_trigger = None):
+    def trigger_func(self, func, points = None, pre_trigger = None, progress = None):
         evnent_name, formater = self.formater[func]
         event = C88xxDebugcoreEvent()
         event.set_func(evnent_name, pre_trigger)
-        return self.trigger(event, points, formater)
+        return self.trigger(event, points, formater, progress)
 
     def func_list(self):
         return [key for key in self.formater]
@@ -225,9 +225,8 @@ class C88xxFrequency(C88xxAnalyzerBase):
 
     def __get_online_cfg(self):
         self.__reset_reg()
-        self.__a08 = self.agent.get_ana(0x08)
-        self.__a13 = self.agent.get_ana(0x13)
-        self.__a15 = self.agent.get_ana(0x15)
+        self.__a08, self.__a13, self.__a15 = \
+                self.agent.get_ana_many([0x08, 0x13, 0x15])
         self.__of9 = self.agent.get_oam(0x7e, 0xf9)
 
     # ==================================
@@ -14,6 +14,18 @@ class C88xxRegister(C88xxAnalyzerBase):
     def set_ana(self, *args, **kw):
         return self.agent.set_ana(*args, **kw)
 
+    def get_oam_many(self, *args, **kw):
+        return self.agent.get_oam_many(*args, **kw)
+
+    def set_oam_many(self, *args, **kw):
+        return self.agent.set_oam_many(*args, **kw)
+
+    def get_ana_many(self, *args, **kw):
+        return self.agent.get_ana_many(*args, **kw)
+
+    def set_ana_many(self, *args, **kw):
+        return self.agent.set_ana_many(*args, **kw)
+
 if __name__ == "__main__":
     from c88xx_analyzer_base import C88xxAgentBase as AgentFactory
     mmp_agent = AgentFactory.get_agent("mmp://eth0")
@@ -1,3 +1,4 @@
+import contextlib
 import collections
 from c88xx_analyzer_base import C88xxAnalyzerBase
 
@@ -138,8 +139,34 @@ class LOInfo(object):
         limit[1] = min(0xff, limit[1])
         return tuple(limit)
 
+'''
+tuner = C89xxTuner(agent)
+
+# field changes go to a shadow of reg 0/1/2, only changed regs are written
+with tuner.batch():
+    tuner.set_pa(pa)
+    tuner.set_lna(lna)
+    tuner.set_lo(lo)        # at most 3 writes for all of them
+                            # IOError if they can not be written
+
+# the device changed behind the tuner
+tuner.sync()
+'''
 @C88xxAnalyzerBase.register("tuner")
 class C89xxTuner(C88xxAnalyzerBase, PAInfo, LNAInfo, LOInfo):
+    # used by set_lo when a reg can not be read
+    REG_DEFAULT = {0:0xac, 1:0x50, 2:0x74}
+
+    def __init__(self, agent = None):
+        C88xxAnalyzerBase.__init__(self, agent)
+        self.__shadow = {}  # reg: value on the device
+        self.__staged = {}  # reg: value to commit
+        self.__batch = 0
+
+    def set_agent(self, agent):
+        C88xxAnalyzerBase.set_agent(self, agent)
+        self.invalidate()
+
     @staticmethod
     def between(start, end, aim):
         '''
@@ -153,18 +180,108 @@ class C89xxTuner(C88xxAnalyzerBase, PAInfo, LNAInfo, LOInfo):
             return False
         return True
 
+    # ------------------------------------------------------
+    # raw access, always on the device
+    # ------------------------------------------------------
     def tuner_get(self, reg):
-        return self.agent.get_tuner(reg)
+        value = self.agent.get_tuner(reg)
+        if value is not None:
+            self.__shadow[reg] = value & 0xff
+        return value
 
     def tuner_set(self, reg, data):
-        return self.agent.set_tuner(reg, data)
+        self.__staged.pop(reg, None)
+        res = self.agent.set_tuner(reg, data)
+        if res is None:
+            self.__shadow.pop(reg, None) # unknown now
+        else:
+            self.__shadow[reg] = data & 0xff
+        return res
 
     def tuner_reset(self):
+        self.invalidate()
         return self.tuner_set(4, 0) and self.tuner_set(4, 1 << 7)
 
+    # ------------------------------------------------------
+    # shadow register file
+    # ------------------------------------------------------
+    def invalidate(self):
+        '''
+        forget the shadow & staged changes, the next access reads the device
+        '''
+        self.__shadow.clear()
+        self.__staged.clear()
+
+    def sync(self, regs = (0, 1, 2)):
+        '''
+        read regs from the device into the shadow, drop their staged changes
+        return True if all of them are read
+        '''
+        ok = True
+        for reg in regs:
+            self.__staged.pop(reg, None)
+            ok = self.tuner_get(reg) is not None and ok
+        return ok
+
+    def commit(self):
+        '''
+        write the staged regs which differ from the shadow, in reg order
+        return not None on success; on failure the unwritten stay staged
+        '''
+        staged = sorted(self.__staged.items())
+        self.__staged.clear()
+        for i, (reg, value) in enumerate(staged):
+            if self.__shadow.get(reg, None) == value:
+                continue
+            if self.tuner_set(reg, value) is None:
+                self.__staged.update(staged[i:])
+                return None
+        return True
+
+    @contextlib.contextmanager
+    def batch(self):
+        '''
+        stage every field change in the block, commit() once at the end;
+        an exception drops the staged changes,
+        a failed commit forgets the shadow & raises IOError
+        '''
+        self.__batch += 1
+        try:
+            yield self
+        except:
+            self.__batch -= 1
+            if not self.__batch:
+                self.__staged.clear()
+            raise
+        self.__batch -= 1
+        if not self.__batch and self.commit() is None:
+            # which regs made it to the device is unknown
+            self.invalidate()
+            raise IOError("tuner commit failed")
+
+    def __get(self, reg):
+        # staged, shadow, then the device
+        if reg in self.__staged:
+            return self.__staged[reg]
+        if reg not in self.__shadow:
+            self.tuner_get(reg)
+        return self.__shadow.get(reg, None)
+
+    def __stage(self, regs):
+        '''
+        regs: {reg: value}
+        '''
+        self.__staged.update(regs)
+        if self.__batch:
+            return True
+        return self.commit()
+
+    # ------------------------------------------------------
+    # fields
+    # ------------------------------------------------------
     def set_pa(self, pa_item):
         pa1, rfvga = pa_item
-        ori_reg = self.tuner_get(2)
+        ori_reg = self.__get(2)
         if ori_reg is None:
             return None
         pa_item = (pa1, rfvga)
@@ -173,15 +290,15 @@ class C89xxTuner(C88xxAnalyzerBase, PAInfo, LNAInfo, LOInfo):
         mask = 0xf << 1
         ori_reg &= ~mask
         pa_reg &= mask
-        return self.tuner_set(2, ori_reg | pa_reg)
+        return self.__stage({2: ori_reg | pa_reg})
 
     def get_pa(self):
-        reg = self.tuner_get(2)
+        reg = self.__get(2)
         if reg is None: return None
         return self.gen_pa_item(reg)
 
     def set_lna(self, lna_item):
-        ori_reg = self.tuner_get(2)
+        ori_reg = self.__get(2)
         if ori_reg is None:
             return None
 
@@ -190,17 +307,17 @@ class C89xxTuner(C88xxAnalyzerBase, PAInfo, LNAInfo, LOInfo):
         mask = 0x3 << 5
         ori_reg &= ~mask
         lna_reg &= mask
-        return self.tuner_set(2, ori_reg | lna_reg)
+        return self.__stage({2: ori_reg | lna_reg})
 
     def get_lna(self):
-        reg = self.tuner_get(2)
+        reg = self.__get(2)
         if reg is None: return None
         return self.gen_lna_item(reg)
 
     def get_lo(self):
-        r0 = self.tuner_get(0)
-        r1 = self.tuner_get(1)
-        r2 = self.tuner_get(2)
+        r0 = self.__get(0)
+        r1 = self.__get(1)
+        r2 = self.__get(2)
 
         if None in (r0, r1, r2):
             return None
@@ -219,9 +336,9 @@ class C89xxTuner(C88xxAnalyzerBase, PAInfo, LNAInfo, LOInfo):
 
     def set_lo(self, lo_item):
         div, n = lo_item
-        r0 = self.tuner_get(0) or 0xac
-        r1 = self.tuner_get(1) or 0x50
-        r2 = self.tuner_get(2) or 0x74
+        r0 = self.__get(0) or self.REG_DEFAULT[0]
+        r1 = self.__get(1) or self.REG_DEFAULT[1]
+        r2 = self.__get(2) or self.REG_DEFAULT[2]
 
         r0_maks = 0x7 << 3
         r0 &= ~r0_maks
@@ -235,9 +352,7 @@ class C89xxTuner(C88xxAnalyzerBase, PAInfo, LNAInfo, LOInfo):
         r2 &= ~r2_mask
         r2 |= r2_mask & (n << 7)
 
-        return self.tuner_set(0, r0) and \
-            self.tuner_set(1, r1) and    \
-            self.tuner_set(2, r2)
+        return self.__stage({0: r0, 1: r1, 2: r2})
 
     def list_lo(self, freq_start = None, freq_end = None):
         '''
@@ -0,0 +1,139 @@
+import numpy as np
+
+'''
+# Usage: Spectrum
+
+    spec = Spectrum("hann")
+
+    # power per bin of one capture, mean square: a sine of amplitude A is A**2/2
+    power = spec.power(adc)
+    freq = spec.freq(200.0)             # MHz, the ADC clock
+    db = Spectrum.to_db(power, 0x200 ** 2 / 2.0)    # dBFS
+
+    # Welch: 512 points segments overlapped by half, averaged
+    spec = Spectrum("hann", nperseg = 512, overlap = 0.5)
+
+    # averaged over repeated captures, exponential after 8 of them
+    spec.reset()
+    spec.averages = 8
+    for i in range(n):
+        power = spec.add(capture())
+
+# Input
+
+    real data gives the one-sided spectrum(rfft), DC .. fs/2
+    complex data the two-sided one, -fs/2 .. fs/2
+'''
+class Spectrum(object):
+    # cosine-sum coefficients, periodic windows
+    windows = {
+        "rect":     (1.0, ),
+        "hann":     (0.5, 0.5),
+        "hamming":  (0.54, 0.46),
+        "blackman": (0.42, 0.5, 0.08),
+        "flattop":  (0.21557895, 0.41663158, 0.277263158, 0.083578947, 0.006947368),
+    }
+
+    def __init__(self, window = "hann", nperseg = None, overlap = 0.5, averages = 0):
+        '''
+        nperseg:  points per segment, None for the whole capture
+        overlap:  fraction of a segment shared with the next
+        averages: captures in the running average of add(), 0 for all
+        '''
+        if window not in self.windows:
+            raise ValueError("unknown window: %s" % window)
+        self.window = window
+        self.nperseg = nperseg
+        self.overlap = overlap
+        self.averages = averages
+        self._windows = {}  # {n: window}
+        self.reset()
+
+    def reset(self):
+        self.count = 0      # captures averaged
+        self._average = None
+        self._shape = None  # (points per segment, one-sided) of the last power()
+
+    def get_window(self, n):
+        w = self._windows.get(n, None)
+        if w is None:
+            k = np.arange(len(self.windows[self.window]))
+            phase = 2 * np.pi * np.arange(n)[:, None] * k / n
+            w = np.dot(np.cos(phase) * (-1) ** k, self.windows[self.window])
+            self._windows[n] = w
+        return w
+
+    def __segments(self, x):
+        '''
+        return [segment][point], views of x
+        '''
+        n = min(self.nperseg or len(x), len(x))
+        step = max(n - int(n * self.overlap), 1)
+        count = (len(x) - n) / step + 1
+        stride = x.strides[0]
+        return np.lib.stride_tricks.as_strided(
+                x, (count, n), (stride * step, stride), writeable = False)
+
+    def power(self, x):
+        '''
+        return power per bin, averaged over the segments of x
+        '''
+        x = np.asarray(x)
+        onesided = not np.iscomplexobj(x)
+        x = x.astype(float if onesided else complex)
+        if len(x) == 0:
+            raise ValueError("no data")
+
+        seg = self.__segments(x)
+        n = seg.shape[1]
+        w = self.get_window(n)
+        if onesided:
+            X = np.fft.rfft(seg * w, axis = 1)
+        else:
+            X = np.fft.fftshift(np.fft.fft(seg * w, axis = 1), axes = 1)
+        power = (X.real ** 2 + X.imag ** 2).mean(axis = 0) / w.sum() ** 2
+        if onesided:
+            # the negative frequencies folded in, but DC & fs/2
+            power[1:(n + 1) / 2] *= 2
+        self._shape = (n, onesided)
+        return power
+
+    def add(self, x):
+        '''
+        add a capture to the running average, restarted if the bins changed
+        return the average
+        '''
+        shape = self._shape
+        power = self.power(x)
+        if self._average is None or shape != self._shape:
+            self.count = 0
+            self._average = np.zeros(len(power))
+        self.count += 1
+        n = self.count
+        if self.averages:
+            n = min(n, self.averages)
+        self._average += (power - self._average) / n
+        return self._average
+
+    def average(self):
+        return self._average
+
+    def freq(self, fs = 1.0):
+        '''
+        fs: sample rate, default 1 for cycles per sample
+        return the frequency of every bin of the last power()
+        '''
+        if self._shape is None:
+            return np.array([])
+        n, onesided = self._shape
+        if onesided:
+            return np.fft.rfftfreq(n, 1.0 / fs)
+        return np.fft.fftshift(np.fft.fftfreq(n, 1.0 / fs))
+
+    @staticmethod
+    def to_db(power, ref = 1.0, offset = 0.0, floor = -300.0):
+        '''
+        10 * log10(power / ref) + offset, floor for the empty bins
+        '''
+        power = np.asarray(power, float) / ref
+        return 10 * np.log10(np.maximum(power, 10 ** (floor / 10))) + offset